@@ -1,32 +1,424 @@
+import time
+STARTUP_STARTED = time.perf_counter()
 import csv
 import os
 import sys
 from pathlib import Path
 import xml.etree.ElementTree as ET
-from xml.dom import minidom
 import subprocess
 import json
-import customtkinter as ctk
-from tkinter import filedialog, messagebox
-from collections import Counter
+try:
+    import customtkinter as ctk
+    import tkinter as tk
+    from tkinter import filedialog, messagebox
+    import tkinter.font as tkfont
+    GUI_IMPORT_ERROR = None
+except ImportError as e: ctk = tk = filedialog = messagebox = tkfont = None; GUI_IMPORT_ERROR = e
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed
 import shutil
 import threading
+import queue
+import logging
 import re
-import urllib.request
+import hashlib
+import functools
 import io
+import tempfile
+import errno
+import contextlib
+import heapq
+import mmap
+import struct
+import weakref
+IMPORTS_FINISHED = time.perf_counter()
+
+# --- Tracing & Profiling ---
+class _Span:
+    __slots__ = ('tracer', 'name', 'args', 'start_ns')
+    def __init__(self, tracer, name, args): self.tracer = tracer; self.name = name; self.args = args
+    def __enter__(self): self.start_ns = time.perf_counter_ns(); return self
+    def __exit__(self, *exc_info): self.tracer.record(self.name, self.start_ns, time.perf_counter_ns(), self.args); return False
+
+class Tracer:
+    NULL_SPAN = contextlib.nullcontext()
+
+    def __init__(self, enabled=True, max_events=200000):
+        self.enabled = enabled; self.max_events = max_events; self.events = []; self.dropped = 0; self._thread_names = {}
+        self._profiles = None; self._profile_local = threading.local(); self._profile_lock = threading.Lock()
+
+    def span(self, name, **args): return _Span(self, name, args) if self.enabled else self.NULL_SPAN
+
+    def record(self, name, start_ns, end_ns, args=None):
+        if not self.enabled: return
+        thread_id = threading.get_ident()
+        if thread_id not in self._thread_names: self._thread_names[thread_id] = threading.current_thread().name
+        if len(self.events) < self.max_events: self.events.append((name, thread_id, start_ns, end_ns - start_ns, args))
+        else: self.dropped += 1
+
+    def reset(self): self.events = []; self.dropped = 0
+
+    def summary(self):
+        stats = {}
+        for name, _, _, duration_ns, _ in self.events:
+            entry = stats.setdefault(name, [0, 0, 0]); entry[0] += 1; entry[1] += duration_ns; entry[2] = max(entry[2], duration_ns)
+        return sorted(((name, count, total / 1e9, total / count / 1e9, longest / 1e9) for name, (count, total, longest) in stats.items()), key=lambda item: item[2], reverse=True)
+
+    def format_summary(self):
+        lines = [f"{'Giai đoạn':<24}{'Số lần':>8}{'Tổng (ms)':>12}{'TB (ms)':>10}{'Max (ms)':>10}"]
+        for name, count, total, mean, longest in self.summary(): lines.append(f"{name:<24}{count:>8}{total * 1000:>12.1f}{mean * 1000:>10.2f}{longest * 1000:>10.1f}")
+        if self.dropped: lines.append(f"(bỏ qua {self.dropped} span vượt giới hạn {self.max_events})")
+        return "\n".join(lines)
+
+    def export_chrome_trace(self, path):
+        pid = os.getpid(); events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}} for tid, name in self._thread_names.items()]
+        origin_ns = min((event[2] for event in self.events), default=0)
+        for name, tid, start_ns, duration_ns, args in self.events:
+            event = {'name': name, 'cat': name.split('.')[0], 'ph': 'X', 'pid': pid, 'tid': tid, 'ts': (start_ns - origin_ns) / 1000, 'dur': duration_ns / 1000}
+            if args: event['args'] = {key: str(value) for key, value in args.items()}
+            events.append(event)
+        with open(path, 'w', encoding='utf-8') as f: json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        return len(events)
+
+    def start_profile(self): self._profiles = []; self._profile_local = threading.local()
+
+    @property
+    def profiling(self): return self._profiles is not None
+
+    def profiled(self, func):
+        if self._profiles is None: return func
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profile = getattr(self._profile_local, 'profile', None)
+            if profile is None:
+                import cProfile
+                profile = self._profile_local.profile = cProfile.Profile()
+                with self._profile_lock: self._profiles.append(profile)
+            if getattr(self._profile_local, 'active', False): return func(*args, **kwargs)
+            self._profile_local.active = True; profile.enable()
+            try: return func(*args, **kwargs)
+            finally: profile.disable(); self._profile_local.active = False
+        return wrapper
+
+    def stop_profile(self, path, top=15):
+        profiles, self._profiles = self._profiles or [], None
+        if not profiles: return None
+        import pstats
+        stats = pstats.Stats(*profiles); stats.dump_stats(str(path)); report = io.StringIO()
+        stats.stream = report; stats.sort_stats('cumulative').print_stats(top)
+        return report.getvalue()
+
+TRACER = Tracer(enabled=False)
 
 # --- Backend Logic ---
-def get_video_metadata(video_path):
+LIGHT_PROBE_ENTRIES = 'stream=codec_type,codec_name,r_frame_rate,nb_frames,duration,width,height,color_transfer,color_space,color_primaries:stream_tags=timecode:format_tags=timecode'
+HEADER_BASED_CONTAINERS = {'.mp4', '.mov', '.m4v', '.mxf'}
+DEEP_PROBE_MARGIN_FRAMES = 3
+
+def get_video_metadata(video_path, light=False):
     command = ['ffprobe', '-v', 'error', '-show_streams', '-show_format', '-of', 'json', str(video_path)]
+    if light:
+        command = ['ffprobe', '-v', 'error', '-show_entries', LIGHT_PROBE_ENTRIES, '-of', 'json', str(video_path)]
+        if Path(video_path).suffix.lower() in HEADER_BASED_CONTAINERS: command[3:3] = ['-probesize', '1000000', '-analyzeduration', '0']
     try:
-        result = subprocess.run(command, capture_output=True, text=True, check=True, encoding='utf-8')
-        return json.loads(result.stdout)
+        with TRACER.span('ffprobe.spawn', path=video_path): result = subprocess.run(command, capture_output=True, text=True, check=True, encoding='utf-8')
+        with TRACER.span('ffprobe.json'): return json.loads(result.stdout)
     except (subprocess.CalledProcessError, FileNotFoundError, KeyError, json.JSONDecodeError):
         return None
 
-def time_to_frames(t, fps):
-    if not t or not isinstance(t, str): return 0
-    t = t.strip()
+def count_video_frames(video_path):
+    command = ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-count_packets', '-show_entries', 'stream=nb_read_packets', '-of', 'csv=p=0', str(video_path)]
+    try:
+        with TRACER.span('ffprobe.count_frames', path=video_path): result = subprocess.run(command, capture_output=True, text=True, check=True, encoding='utf-8')
+        return int(result.stdout.strip().split(',')[0])
+    except (subprocess.CalledProcessError, FileNotFoundError, ValueError, IndexError):
+        return None
+
+# --- Native MP4/MOV Header Parsing ---
+NATIVE_HEADER_CONTAINERS = {'.mp4', '.mov', '.m4v'}
+MP4_CONTAINER_BOXES = {b'mdia', b'minf', b'stbl', b'tref'}
+MP4_VIDEO_CODECS = {b'avc1': 'h264', b'avc3': 'h264', b'hvc1': 'hevc', b'hev1': 'hevc', b'dvh1': 'hevc', b'dvhe': 'hevc', b'apch': 'prores', b'apcn': 'prores', b'apcs': 'prores', b'apco': 'prores', b'ap4h': 'prores', b'ap4x': 'prores',
+                    b'mp4v': 'mpeg4', b'jpeg': 'mjpeg', b'mjpa': 'mjpeg', b'av01': 'av1', b'vp09': 'vp9', b'xd5b': 'mpeg2video', b'xd5c': 'mpeg2video', b'xd5e': 'mpeg2video', b'xdvc': 'mpeg2video', b'dvc ': 'dvvideo', b'dvcp': 'dvvideo', b'dv5p': 'dvvideo'}
+MP4_AUDIO_CODECS = {b'mp4a': 'aac', b'ac-3': 'ac3', b'ec-3': 'eac3', b'lpcm': 'pcm_s16le', b'sowt': 'pcm_s16le', b'twos': 'pcm_s16be', b'in24': 'pcm_s24be', b'in32': 'pcm_s32be', b'fl32': 'pcm_f32be', b'ipcm': 'pcm_s16le', b'Opus': 'opus'}
+COLOR_PRIMARIES_NAMES = {1: 'bt709', 4: 'bt470m', 5: 'bt470bg', 6: 'smpte170m', 7: 'smpte240m', 8: 'film', 9: 'bt2020', 10: 'smpte428', 11: 'smpte431', 12: 'smpte432', 22: 'jedec-p22'}
+COLOR_TRANSFER_NAMES = {1: 'bt709', 4: 'gamma22', 5: 'gamma28', 6: 'smpte170m', 7: 'smpte240m', 8: 'linear', 9: 'log100', 10: 'log316', 11: 'iec61966-2-4', 12: 'bt1361e', 13: 'iec61966-2-1', 14: 'bt2020-10', 15: 'bt2020-12', 16: 'smpte2084', 17: 'smpte428', 18: 'arib-std-b67'}
+COLOR_SPACE_NAMES = {0: 'gbr', 1: 'bt709', 4: 'fcc', 5: 'bt470bg', 6: 'smpte170m', 7: 'smpte240m', 8: 'ycgco', 9: 'bt2020nc', 10: 'bt2020c', 11: 'smpte2085', 12: 'chroma-derived-nc', 13: 'chroma-derived-c', 14: 'ictcp'}
+H264_HIGH_PROFILES = {100, 110, 122, 244, 44, 83, 86, 118, 128, 138, 139, 134, 135}
+
+def _iter_boxes(data, start, end):
+    while start + 8 <= end:
+        size, kind = struct.unpack_from('>I4s', data, start); header = 8
+        if size == 1: size = struct.unpack_from('>Q', data, start + 8)[0]; header = 16
+        elif size == 0: size = end - start
+        if size < header or start + size > end: return
+        yield kind, start + header, start + size
+        start += size
+
+def _collect_boxes(data, start, end, found):
+    for kind, body, box_end in _iter_boxes(data, start, end):
+        if kind in MP4_CONTAINER_BOXES: _collect_boxes(data, body, box_end, found)
+        else: found.setdefault(kind, (body, box_end))
+    return found
+
+class _BitReader:
+    __slots__ = ('data', 'position')
+
+    def __init__(self, data): self.data = data; self.position = 0
+
+    def bits(self, count):
+        value = 0
+        for _ in range(count): value = (value << 1) | ((self.data[self.position >> 3] >> (7 - (self.position & 7))) & 1); self.position += 1
+        return value
+
+    def ue(self):
+        zeros = 0
+        while not self.bits(1):
+            zeros += 1
+            if zeros > 31: raise ValueError("Exp-Golomb code quá dài")
+        return (1 << zeros) - 1 + self.bits(zeros)
+
+    def se(self): value = self.ue(); return (value + 1) // 2 if value & 1 else -(value // 2)
+
+def h264_colour_description(sps):
+    """Returns (primaries, transfer, matrix) from an H.264 SPS NAL unit, () when the VUI carries none."""
+    r = _BitReader(sps[1:].replace(b'\x00\x00\x03', b'\x00\x00')); profile_idc = r.bits(8); r.bits(16); r.ue()
+    if profile_idc in H264_HIGH_PROFILES:
+        chroma_format_idc = r.ue()
+        if chroma_format_idc == 3: r.bits(1)
+        r.ue(); r.ue(); r.bits(1)
+        if r.bits(1):
+            for i in range(12 if chroma_format_idc == 3 else 8):
+                if not r.bits(1): continue
+                last_scale = next_scale = 8
+                for _ in range(16 if i < 6 else 64):
+                    if next_scale: next_scale = (last_scale + r.se()) % 256
+                    last_scale = next_scale or last_scale
+    r.ue(); poc_type = r.ue()
+    if poc_type == 0: r.ue()
+    elif poc_type == 1:
+        r.bits(1); r.se(); r.se()
+        for _ in range(r.ue()): r.se()
+    r.ue(); r.bits(1); r.ue(); r.ue()
+    if not r.bits(1): r.bits(1)
+    r.bits(1)
+    if r.bits(1): r.ue(); r.ue(); r.ue(); r.ue()
+    if not r.bits(1): return ()
+    if r.bits(1) and r.bits(8) == 255: r.bits(32)
+    if r.bits(1): r.bits(1)
+    if not r.bits(1): return ()
+    r.bits(4)
+    return (r.bits(8), r.bits(8), r.bits(8)) if r.bits(1) else ()
+
+def _sample_entry_colour(data, codec, children_start, entry_end):
+    """Colour codes of a visual sample entry: the colr box when present, else the H.264 SPS; None when neither can be read."""
+    children = _collect_boxes(data, children_start, entry_end, {})
+    if b'colr' in children:
+        body, _ = children[b'colr']
+        if data[body:body + 4] in (b'nclx', b'nclc'): return struct.unpack_from('>HHH', data, body + 4)
+    if codec == 'h264' and b'avcC' in children:
+        body, box_end = children[b'avcC']
+        if data[body + 5] & 0x1f:
+            sps_length = struct.unpack_from('>H', data, body + 6)[0]
+            if body + 8 + sps_length <= box_end: return h264_colour_description(bytes(data[body + 8:body + 8 + sps_length]))
+    return None
+
+def _read_tmcd_timecode(data, boxes, entry_body):
+    flags, timescale, frame_duration, number_of_frames = struct.unpack_from('>IIIB', data, entry_body + 12)
+    if b'stco' in boxes: offset = struct.unpack_from('>I', data, boxes[b'stco'][0] + 8)[0]
+    elif b'co64' in boxes: offset = struct.unpack_from('>Q', data, boxes[b'co64'][0] + 8)[0]
+    else: return None
+    if offset + 4 > len(data) or not number_of_frames: return None
+    frame_number = struct.unpack_from('>I', data, offset)[0]; drop_frame = flags & 1 and frame_duration
+    timecode = frames_to_timecode(frame_number, timescale / frame_duration if drop_frame else number_of_frames)
+    if flags & 2: hours, rest = timecode.split(':', 1); timecode = f"{int(hours) % 24:02d}:{rest}"
+    return timecode
+
+def _parse_mp4_track(data, start, end):
+    boxes = _collect_boxes(data, start, end, {})
+    if b'hdlr' not in boxes or b'mdhd' not in boxes or b'stsd' not in boxes: return None
+    handler = bytes(data[boxes[b'hdlr'][0] + 8:boxes[b'hdlr'][0] + 12]); mdhd = boxes[b'mdhd'][0]; tkhd = boxes.get(b'tkhd')
+    timescale, duration = struct.unpack_from('>IQ', data, mdhd + 20) if data[mdhd] == 1 else struct.unpack_from('>II', data, mdhd + 12)
+    track = {'handler': handler, 'id': struct.unpack_from('>I', data, tkhd[0] + (20 if data[tkhd[0]] == 1 else 12))[0] if tkhd else 0, 'tmcd_refs': ()}
+    if b'tmcd' in boxes: body, box_end = boxes[b'tmcd']; track['tmcd_refs'] = struct.unpack_from(f'>{(box_end - body) // 4}I', data, body)
+    stsd_body, stsd_end = boxes[b'stsd']
+    if struct.unpack_from('>I', data, stsd_body + 4)[0] < 1 or stsd_body + 16 > stsd_end: return None
+    entry_size, fourcc = struct.unpack_from('>I4s', data, stsd_body + 8); entry_body = stsd_body + 16; entry_end = min(stsd_body + 8 + entry_size, stsd_end)
+    if handler == b'vide':
+        codec = MP4_VIDEO_CODECS.get(fourcc)
+        if codec is None or b'stts' not in boxes or not timescale: return None
+        stts_body = boxes[b'stts'][0]; entry_count = struct.unpack_from('>I', data, stts_body + 4)[0]
+        deltas = Counter(); frame_count = 0
+        for sample_count, delta in struct.iter_unpack('>II', data[stts_body + 8:stts_body + 8 + entry_count * 8]): deltas[delta] += sample_count; frame_count += sample_count
+        if not deltas: return None
+        from fractions import Fraction
+        frame_rate = Fraction(timescale, deltas.most_common(1)[0][0]); width, height = struct.unpack_from('>HH', data, entry_body + 24)
+        colour = _sample_entry_colour(data, codec, entry_body + 78, entry_end)
+        if colour is None: return None
+        stream = {'codec_type': 'video', 'codec_name': codec, 'width': width, 'height': height, 'r_frame_rate': f"{frame_rate.numerator}/{frame_rate.denominator}", 'nb_frames': str(frame_count), 'duration': f"{duration / timescale:.6f}"}
+        if colour:
+            primaries, transfer, matrix = colour
+            for key, names, code in (('color_primaries', COLOR_PRIMARIES_NAMES, primaries), ('color_transfer', COLOR_TRANSFER_NAMES, transfer), ('color_space', COLOR_SPACE_NAMES, matrix)):
+                if code in names: stream[key] = names[code]
+        track['stream'] = stream
+    elif handler == b'soun': track['stream'] = {'codec_type': 'audio', 'codec_name': MP4_AUDIO_CODECS.get(fourcc, fourcc.decode('latin-1').strip())}
+    elif handler == b'tmcd' and fourcc == b'tmcd':
+        timecode = _read_tmcd_timecode(data, boxes, entry_body); track['stream'] = {'codec_type': 'data'}
+        if timecode: track['stream']['tags'] = {'timecode': timecode}
+    return track
+
+def read_mp4_header(video_path):
+    """Reads the ffprobe-shaped metadata of an MP4/MOV straight from its moov box, or returns None so the caller falls back to ffprobe."""
+    try:
+        with open(video_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data, TRACER.span('native.header', path=video_path):
+            moov = next(((body, box_end) for kind, body, box_end in _iter_boxes(data, 0, len(data)) if kind == b'moov'), None)
+            if moov is None: return None
+            tracks = [track for kind, body, box_end in _iter_boxes(data, *moov) if kind == b'trak' for track in (_parse_mp4_track(data, body, box_end),) if track is not None]
+    except (OSError, ValueError, struct.error, IndexError): return None
+    if not any(track['handler'] == b'vide' and 'stream' in track for track in tracks) or any(track['handler'] == b'vide' and 'stream' not in track for track in tracks): return None
+    timecodes = {track['id']: track['stream'].get('tags', {}).get('timecode') for track in tracks if track['handler'] == b'tmcd' and 'stream' in track}
+    for track in tracks:
+        timecode = next((timecodes[ref] for ref in track['tmcd_refs'] if timecodes.get(ref)), None)
+        if timecode and track['handler'] == b'vide': track['stream']['tags'] = {'timecode': timecode}
+    return {'streams': [track['stream'] for track in tracks if 'stream' in track], 'format': {}}
+
+def probe_media(video_path, light=False, native=True):
+    if native and light and Path(video_path).suffix.lower() in NATIVE_HEADER_CONTAINERS:
+        metadata = read_mp4_header(video_path)
+        if metadata is not None: return metadata
+    return get_video_metadata(video_path, light)
+
+def probe_variant(light, native=True):
+    return 'full' if not light else 'light-native' if native else 'light'
+
+class MetadataCache:
+    COMMIT_EVERY = 64
+    COMMIT_INTERVAL = 2.0
+
+    def __init__(self, db_path, max_entries=20000):
+        import sqlite3
+        self.db_path = str(db_path); self.max_entries = max_entries; self.hits = 0; self.misses = 0; self._lock = threading.Lock(); self._pending_writes = 0; self._last_commit = time.monotonic()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL"); self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, path TEXT NOT NULL, data TEXT NOT NULL, last_used REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_metadata_path ON metadata(path)"); self._conn.execute("CREATE INDEX IF NOT EXISTS idx_metadata_last_used ON metadata(last_used)"); self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM metadata").fetchone()[0]
+
+    @staticmethod
+    def make_key(video_path, variant='full'):
+        resolved = Path(video_path).resolve(); st = resolved.stat(); stamp = f"{resolved}|{st.st_size}|{st.st_mtime_ns}|"
+        return stamp + variant, stamp, str(resolved)
+
+    def get(self, video_path, variant='full'):
+        try: key, _, _ = self.make_key(video_path, variant)
+        except OSError: return None
+        with self._lock:
+            found = self._conn.execute("SELECT data FROM metadata WHERE key = ?", (key,)).fetchone()
+            if found is None: return None
+            self._conn.execute("UPDATE metadata SET last_used = ? WHERE key = ?", (time.time(), key)); self._note_write()
+        return json.loads(found[0])
+
+    def put(self, video_path, metadata, variant='full'):
+        try: key, stamp, resolved = self.make_key(video_path, variant)
+        except OSError: return
+        with self._lock:
+            self._count -= self._conn.execute("DELETE FROM metadata WHERE path = ? AND substr(key, 1, ?) != ?", (resolved, len(stamp), stamp)).rowcount
+            data = json.dumps(metadata, separators=(',', ':')); now = time.time()
+            if self._conn.execute("INSERT OR IGNORE INTO metadata (key, path, data, last_used) VALUES (?, ?, ?, ?)", (key, resolved, data, now)).rowcount: self._count += 1
+            else: self._conn.execute("UPDATE metadata SET data = ?, last_used = ? WHERE key = ?", (data, now, key))
+            if self._count > self.max_entries: self._count -= self._conn.execute("DELETE FROM metadata WHERE key IN (SELECT key FROM metadata ORDER BY last_used LIMIT ?)", (self._count - self.max_entries,)).rowcount
+            self._note_write()
+
+    def _note_write(self):
+        self._pending_writes += 1
+        if self._pending_writes >= self.COMMIT_EVERY or time.monotonic() - self._last_commit >= self.COMMIT_INTERVAL: self._commit()
+
+    def _commit(self): self._conn.commit(); self._pending_writes = 0; self._last_commit = time.monotonic()
+
+    def get_or_probe(self, video_path, probe=get_video_metadata, variant='full'):
+        metadata = self.get(video_path, variant)
+        with self._lock:
+            if metadata is not None: self.hits += 1; return metadata
+            self.misses += 1
+        metadata = probe(video_path)
+        if metadata is not None: self.put(video_path, metadata, variant)
+        return metadata
+
+    def invalidate(self, video_path=None):
+        with self._lock:
+            if video_path is None: removed = self._conn.execute("DELETE FROM metadata").rowcount
+            else: removed = self._conn.execute("DELETE FROM metadata WHERE path = ?", (str(Path(video_path).resolve()),)).rowcount
+            self._count -= removed; self._commit()
+        return removed
+
+    def flush(self):
+        with self._lock: self._commit()
+
+    def reset_stats(self): self.hits = 0; self.misses = 0
+
+class ScanStateStore:
+    STABLE_STATUSES = frozenset({'ok', 'skipped', 'gap', 'File not found', 'Time format error', 'Out time < In time'})
+
+    def __init__(self, db_path):
+        import sqlite3
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False); self._lock = threading.Lock()
+        self._conn.execute("CREATE TABLE IF NOT EXISTS scan_rows (csv_path TEXT NOT NULL, fingerprint TEXT NOT NULL, data TEXT NOT NULL, framerate REAL, PRIMARY KEY (csv_path, fingerprint))"); self._conn.commit()
+
+    @staticmethod
+    def row_fingerprint(row, video_path, file_stat, probe_variant):
+        return hashlib.sha1(json.dumps([row.get('filename', ''), row.get('Time in - time out', ''), video_path, file_stat, probe_variant]).encode('utf-8')).hexdigest()
+
+    def load(self, csv_path):
+        with self._lock: stored = self._conn.execute("SELECT fingerprint, data, framerate FROM scan_rows WHERE csv_path = ?", (os.path.abspath(csv_path),)).fetchall()
+        rows = ((fingerprint, json.loads(data), framerate) for fingerprint, data, framerate in stored)
+        return {fingerprint: (row, framerate) for fingerprint, row, framerate in rows if row.get('status') in self.STABLE_STATUSES}
+
+    def save(self, csv_path, entries):
+        csv_key = os.path.abspath(csv_path)
+        with self._lock:
+            self._conn.execute("DELETE FROM scan_rows WHERE csv_path = ?", (csv_key,))
+            self._conn.executemany("INSERT OR REPLACE INTO scan_rows (csv_path, fingerprint, data, framerate) VALUES (?, ?, ?, ?)", ((csv_key, fingerprint, json.dumps(row.to_dict(), separators=(',', ':')), framerate) for fingerprint, row, framerate in entries if row.status in self.STABLE_STATUSES))
+            self._conn.commit()
+
+    def forget(self, csv_path=None):
+        with self._lock:
+            if csv_path is None: self._conn.execute("DELETE FROM scan_rows")
+            else: self._conn.execute("DELETE FROM scan_rows WHERE csv_path = ?", (os.path.abspath(csv_path),))
+            self._conn.commit()
+
+class ProgressReporter:
+    def __init__(self, total=0, unit='dòng', scale=1, decimals=0):
+        self.total = total; self.unit = unit; self.scale = scale; self.decimals = decimals; self.label = ''; self.finished = False
+        self._parts = {}; self.started = time.perf_counter()
+
+    def advance(self, amount=1, label=None):
+        thread_id = threading.get_ident(); self._parts[thread_id] = self._parts.get(thread_id, 0) + amount
+        if label is not None: self.label = label
+
+    def finish(self): self.finished = True
+
+    @property
+    def done(self): return sum(list(self._parts.values()))
+
+    def fraction(self): return min(1.0, self.done / self.total) if self.total else 0.0
+
+    def describe(self):
+        done = self.done; rate = done / max(time.perf_counter() - self.started, 1e-6); d = self.decimals
+        text = f"{done / self.scale:.{d}f}/{self.total / self.scale:.{d}f} {self.unit} · {rate / self.scale:.1f} {self.unit}/s"
+        if rate > 0 and self.total > done: remaining = int((self.total - done) / rate); text += f" · còn ~{remaining // 60}:{remaining % 60:02d}"
+        return text
+
+def sample_progress(widget, reporter, bar, label, prefix, interval_ms=100):
+    if not widget.winfo_exists(): return
+    bar.set(reporter.fraction()); label.configure(text=f"{prefix} {reporter.describe()}" + (f" — {reporter.label}" if reporter.label else ""))
+    if not reporter.finished: widget.after(interval_ms, sample_progress, widget, reporter, bar, label, prefix, interval_ms)
+
+# --- Timecode Engine ---
+TIMECODE_RE = re.compile(r'(\d+)[:;](\d+)[:;](\d+)([:;])(\d+)')
+CLOCK_TIME_RE = re.compile(r'\d+(?:\.\d+)?(?::\d+(?:\.\d+)?){1,2}')
+INOUT_RE = re.compile(r'\s*([\d:;.]+)\s*-\s*([\d:;.]+)\s*')
+DROP_FRAME_RATES = {29.97: (30, 2), 59.94: (60, 4)}
+
+def _legacy_time_to_frames(t, fps):
     if t.count(':') == 3:
         parts = t.split(':'); h, m, s, f = map(int, parts)
         return (h * 3600 + m * 60 + s) * fps + f
@@ -35,7 +427,42 @@ def time_to_frames(t, fps):
     elif len(parts) == 3: h, m, s = parts; return round((h * 3600 + m * 60 + s) * fps)
     raise ValueError(f"Dinh dang thoi gian khong hop le: {t}")
 
-def parse_inout(s, fps):
+def drop_frame_to_frames(h, m, s, f, fps):
+    nominal, dropped = DROP_FRAME_RATES[round(float(fps), 2)]; total_minutes = 60 * h + m
+    return nominal * (3600 * h + 60 * m + s) + f - dropped * (total_minutes - total_minutes // 10)
+
+def frames_to_timecode(frames, fps):
+    frames = int(round(frames)); rate_key = round(float(fps), 2); separator = ':'
+    if rate_key in DROP_FRAME_RATES:
+        nominal, dropped = DROP_FRAME_RATES[rate_key]; separator = ';'
+        frames_per_10_minutes = nominal * 600 - dropped * 9; frames_per_minute = nominal * 60 - dropped
+        tens, remainder = divmod(frames, frames_per_10_minutes)
+        frames += dropped * 9 * tens + (dropped * ((remainder - dropped) // frames_per_minute) if remainder > dropped else 0)
+    else: nominal = max(1, round(float(fps)))
+    return f"{frames // (nominal * 3600):02d}:{frames // (nominal * 60) % 60:02d}:{frames // nominal % 60:02d}{separator}{frames % nominal:02d}"
+
+@functools.lru_cache(maxsize=65536, typed=True)
+def _time_to_frames_cached(t, fps):
+    match = TIMECODE_RE.fullmatch(t)
+    if match:
+        h, m, s, f = int(match.group(1)), int(match.group(2)), int(match.group(3)), int(match.group(5))
+        if ';' in t and round(float(fps), 2) in DROP_FRAME_RATES: return drop_frame_to_frames(h, m, s, f, fps)
+        if ';' not in t: return (h * 3600 + m * 60 + s) * fps + f
+    elif CLOCK_TIME_RE.fullmatch(t):
+        parts = [float(x) for x in t.split(':')]
+        if len(parts) == 2: return round((parts[0] * 60 + parts[1]) * fps)
+        return round((parts[0] * 3600 + parts[1] * 60 + parts[2]) * fps)
+    if ';' in t: t = t.replace(';', ':')
+    return _legacy_time_to_frames(t, fps)
+
+def time_to_frames(t, fps):
+    if not t or not isinstance(t, str): return 0
+    return _time_to_frames_cached(t.strip(), fps)
+
+@functools.lru_cache(maxsize=65536, typed=True)
+def _parse_inout_cached(s, fps):
+    match = INOUT_RE.fullmatch(s)
+    if match: return time_to_frames(match.group(1), float(fps)), time_to_frames(match.group(2), float(fps))
     s = s.strip()
     if '-' not in s:
         last_colon_index = s.rfind(':')
@@ -46,42 +473,960 @@ def parse_inout(s, fps):
     ins, outs = s.split('-')
     return time_to_frames(ins.strip(), float(fps)), time_to_frames(outs.strip(), float(fps))
 
-def find_video_file(video_folder, base_filename):
-    if not base_filename: return None
-    folder = Path(video_folder)
-    p_filename = Path(base_filename)
-    candidates = [
-        folder / f"{p_filename.stem}_Proxy.mp4",
-        folder / f"{p_filename.name}_Proxy.mp4",
-        folder / p_filename.name
-    ]
-    for path in candidates:
-        if path.exists():
-            return str(path)
-    return None
+def parse_inout(s, fps): return _parse_inout_cached(s, fps)
+
+def benchmark_timecode(row_count=200000, repeat=3):
+    samples = ['0:03-0:33', '00:01 - 00:21', '2:45 - 3:02', '1:02:03 - 1:02:09', '01:00:00:00-01:00:10:12', '01:00:00;00 - 01:00:10;12', '00:05 (mời các bạn) - 01:50', '12:34-12:40']
+    values = [samples[i % len(samples)] if i % 7 else f"{i // 60 % 60}:{i % 60:02d} - {(i + 9) // 60 % 60}:{(i + 9) % 60:02d}" for i in range(row_count)]
+    def legacy_parse(s, fps):
+        s = s.strip()
+        if '-' not in s:
+            last_colon_index = s.rfind(':')
+            if last_colon_index == -1: raise ValueError(s)
+            s = f"{s[:last_colon_index]} - {s[last_colon_index+1:]}"
+        ins, outs = s.split('-')
+        return _legacy_time_to_frames(ins.strip(), float(fps)), _legacy_time_to_frames(outs.strip(), float(fps))
+    def run_legacy(fps):
+        for value in values:
+            try: legacy_parse(value, fps)
+            except ValueError: pass
+    def run_per_row(fps):
+        for value in values:
+            try: parse_inout(value, fps)
+            except ValueError: pass
+    def best_of(func):
+        timings = []
+        for _ in range(repeat): started = time.perf_counter(); func(); timings.append(time.perf_counter() - started)
+        return min(timings)
+    results = {'rows': row_count}
+    for fps in (25.0, 29.97):
+        _time_to_frames_cached.cache_clear(); _parse_inout_cached.cache_clear()
+        results[f'legacy_{fps}'] = best_of(lambda: run_legacy(fps))
+        started = time.perf_counter(); run_per_row(fps); results[f'per_row_cold_{fps}'] = time.perf_counter() - started
+        results[f'per_row_warm_{fps}'] = best_of(lambda: run_per_row(fps))
+    return results
+
+class MediaIndex:
+    def __init__(self, root, recursive=False, store_path=None):
+        self.root = os.path.abspath(str(root)); self.recursive = recursive; self.store_path = Path(store_path) if store_path else None
+        self._dirs = {}; self._names = {}; self._lock = threading.Lock(); self._dirty = False; self.generation = 0
+        self._load()
+
+    def _load(self):
+        if not self.store_path or not self.store_path.exists(): return
+        try:
+            stored = json.loads(self.store_path.read_text(encoding='utf-8'))
+            if stored.get('root') == self.root and stored.get('recursive') == self.recursive: self._dirs = {d: tuple(v) for d, v in stored['dirs'].items()}; self._rebuild_names()
+        except (OSError, ValueError, KeyError, TypeError): self._dirs = {}
+
+    def save(self):
+        if not self.store_path or not self._dirty: return
+        with self._lock: payload = {'root': self.root, 'recursive': self.recursive, 'dirs': self._dirs}
+        tmp_path = self.store_path.with_suffix('.tmp'); tmp_path.write_text(json.dumps(payload, separators=(',', ':')), encoding='utf-8'); os.replace(tmp_path, self.store_path); self._dirty = False
+
+    def _scan_dir(self, directory):
+        files = []; subdirs = []
+        with os.scandir(directory) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(): subdirs.append(entry.name)
+                    elif entry.is_file(): files.append(entry.name)
+                except OSError: continue
+        return os.stat(directory).st_mtime_ns, sorted(files), sorted(subdirs)
+
+    def refresh(self):
+        with self._lock, TRACER.span('media.index_refresh', root=self.root):
+            changed = False; pending = [self.root]; seen = set()
+            while pending:
+                directory = pending.pop(0); seen.add(directory)
+                try: mtime_ns = os.stat(directory).st_mtime_ns
+                except OSError: continue
+                known = self._dirs.get(directory)
+                if known is None or known[0] != mtime_ns:
+                    try: self._dirs[directory] = self._scan_dir(directory); changed = True
+                    except OSError: continue
+                if self.recursive: pending.extend(os.path.join(directory, name) for name in self._dirs[directory][2])
+            for directory in [d for d in self._dirs if d not in seen]: del self._dirs[directory]; changed = True
+            if changed: self._rebuild_names(); self._dirty = True; self.generation += 1
+        return changed
+
+    def directory_mtimes(self):
+        with self._lock: directories = sorted(self._dirs) or [self.root]
+        mtimes = []
+        for directory in directories:
+            try: mtimes.append((directory, os.stat(directory).st_mtime_ns))
+            except OSError: mtimes.append((directory, None))
+        return tuple(mtimes)
+
+    def _rebuild_names(self):
+        names = {}; pending = [self.root]
+        while pending:
+            directory = pending.pop(0); known = self._dirs.get(directory)
+            if known is None: continue
+            for name in known[1]: names.setdefault(name.lower(), os.path.join(directory, name))
+            if self.recursive: pending.extend(os.path.join(directory, name) for name in known[2])
+        self._names = names
+
+    def find(self, base_filename):
+        if not base_filename: return None
+        with TRACER.span('media.lookup'):
+            p_filename = Path(base_filename)
+            for candidate in (f"{p_filename.stem}_Proxy.mp4", f"{p_filename.name}_Proxy.mp4", p_filename.name):
+                found = self._names.get(candidate.lower())
+                if found: return found
+        return None
+
+    def __len__(self): return len(self._names)
+
+    def paths(self): return list(self._names.values())
+
+MEDIA_EXTENSIONS = {'.mp4', '.mov', '.mxf', '.mts', '.m4v', '.avi', '.wmv', '.flv', '.webm'}
+NAME_SEPARATORS_RE = re.compile(r'[\W_]+')
+FUZZY_HIGH_CONFIDENCE = 0.85
+
+def normalize_media_name(name):
+    name = name.strip().lower()
+    for _ in range(2):
+        stem, extension = os.path.splitext(name)
+        if extension in MEDIA_EXTENSIONS: name = stem
+        if name.endswith('_proxy'): name = name[:-6]
+    return NAME_SEPARATORS_RE.sub('', name)
+
+def _name_trigrams(key):
+    padded = f"^{key}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def edit_distance(a, b):
+    if a == b: return 0
+    if len(a) > len(b): a, b = b, a
+    if not a: return len(b)
+    pattern_masks = {}
+    for i, char in enumerate(a): pattern_masks[char] = pattern_masks.get(char, 0) | (1 << i)
+    mask = (1 << len(a)) - 1; high_bit = 1 << (len(a) - 1); positive = mask; negative = 0; score = len(a)
+    for char in b:
+        equal = pattern_masks.get(char, 0); vertical = equal | negative
+        horizontal = (((equal & positive) + positive) ^ positive) | equal
+        horizontal_positive = negative | ~(horizontal | positive) & mask; horizontal_negative = positive & horizontal
+        if horizontal_positive & high_bit: score += 1
+        elif horizontal_negative & high_bit: score -= 1
+        horizontal_positive = ((horizontal_positive << 1) | 1) & mask; horizontal_negative = (horizontal_negative << 1) & mask
+        positive = horizontal_negative | ~(vertical | horizontal_positive) & mask; negative = horizontal_positive & vertical
+    return score
+
+class FuzzyNameIndex:
+    def __init__(self, paths, max_postings=1500, rerank=8):
+        self.max_postings = max_postings; self.rerank = rerank; self._keys = []; self._names = []; self._key_ids = {}; self._postings = {}
+        for path in paths:
+            name = os.path.basename(path); key = normalize_media_name(name)
+            if not key: continue
+            key_id = self._key_ids.get(key)
+            if key_id is None:
+                key_id = self._key_ids[key] = len(self._keys); self._keys.append(key); self._names.append([])
+                for gram in _name_trigrams(key): self._postings.setdefault(gram, []).append(key_id)
+            self._names[key_id].append(name)
+        for names in self._names: names.sort(key=lambda name: ('_proxy' in name.lower(), name))
+
+    def __len__(self): return len(self._keys)
+
+    def suggest(self, filename, limit=3):
+        key = normalize_media_name(filename or '')
+        if not key: return []
+        counts = Counter(); budget = self.max_postings
+        for posting in sorted((self._postings[gram] for gram in _name_trigrams(key) if gram in self._postings), key=len):
+            if len(posting) > budget and counts: break
+            counts.update(posting); budget -= len(posting)
+        candidates = set(heapq.nlargest(self.rerank, counts, key=counts.__getitem__))
+        exact_id = self._key_ids.get(key)
+        if exact_id is not None: candidates.add(exact_id)
+        scored = [(1 - edit_distance(key, self._keys[key_id]) / max(len(key), len(self._keys[key_id])), key_id) for key_id in candidates]
+        return [(self._names[key_id][0], round(score, 3)) for score, key_id in heapq.nlargest(limit, scored)]
+
+    def best_match(self, filename):
+        suggestions = self.suggest(filename, limit=2)
+        if not suggestions: return None
+        name, score = suggestions[0]
+        if score < FUZZY_HIGH_CONFIDENCE or (len(suggestions) > 1 and suggestions[1][1] == score): return None
+        return name
+
+# --- Row Model ---
+def _optional_number(value, kind):
+    if value is None or value == '': return None
+    return kind(float(value)) if isinstance(value, str) else kind(value)
+
+class SourceMedia:
+    __slots__ = ('full_path', 'codec', 'color_profile', 'framerate', 'duration_frames', 'start_timecode', 'audio_tracks', 'width', 'height', '_start_frame', '_key', '__weakref__')
+    FIELDS = ('full_path', 'codec', 'color_profile', 'framerate', 'duration_frames', 'start_timecode', 'audio_tracks', 'width', 'height')
+    NUMERIC = {'framerate': float, 'duration_frames': int, 'audio_tracks': int, 'width': int, 'height': int}
+    _pool = weakref.WeakValueDictionary(); _pool_lock = threading.Lock()
+
+    def __init__(self, full_path=None, codec=None, color_profile=None, framerate=None, duration_frames=None, start_timecode=None, audio_tracks=None, width=None, height=None):
+        self.full_path = full_path; self.codec = codec; self.color_profile = color_profile; self.start_timecode = start_timecode
+        self.framerate = _optional_number(framerate, float); self.duration_frames = _optional_number(duration_frames, int); self.audio_tracks = _optional_number(audio_tracks, int)
+        self.width = _optional_number(width, int); self.height = _optional_number(height, int); self._start_frame = None
+        self._key = (full_path, codec, color_profile, self.framerate, self.duration_frames, start_timecode, self.audio_tracks, self.width, self.height)
+
+    @classmethod
+    def shared(cls, fields):
+        source = cls(**fields)
+        with cls._pool_lock:
+            existing = cls._pool.get(source._key)
+            if existing is not None: return existing
+            cls._pool[source._key] = source
+        return source
+
+    def replace(self, **changes): return SourceMedia.shared({**{field: getattr(self, field) for field in self.FIELDS}, **changes})
+
+    @property
+    def start_frame(self):
+        if self._start_frame is None: self._start_frame = time_to_frames(self.start_timecode or '00:00:00:00', self.framerate)
+        return self._start_frame
+
+    def legacy_value(self, field):
+        value = getattr(self, field)
+        if value is None: return None
+        if field == 'framerate': return f"{value:.3f}"
+        if field == 'duration_frames': return str(value)
+        return value
+
+    def __eq__(self, other): return isinstance(other, SourceMedia) and self._key == other._key
+
+    def __hash__(self): return hash(self._key)
+
+EMPTY_SOURCE = SourceMedia.shared({})
+
+class ScanRow:
+    __slots__ = ('filename', 'timecode', 'type', 'status', 'source', 'extra')
+    ROW_FIELDS = {'filename': 'filename', 'Time in - time out': 'timecode', 'type': 'type', 'status': 'status'}
+    SOURCE_FIELDS = frozenset(SourceMedia.FIELDS)
+
+    def __init__(self, filename='', timecode='', type=None, status=None, source=EMPTY_SOURCE, extra=None):
+        self.filename = filename; self.timecode = timecode; self.type = type; self.status = status; self.source = source; self.extra = extra
+
+    @classmethod
+    def from_dict(cls, data):
+        row = cls(data.get('filename', ''), data.get('Time in - time out', ''), data.get('type'), data.get('status'))
+        source_fields = {field: data[field] for field in SourceMedia.FIELDS if data.get(field) is not None}
+        if source_fields: row.source = SourceMedia.shared(source_fields)
+        extra = {key: value for key, value in data.items() if key not in cls.ROW_FIELDS and key not in cls.SOURCE_FIELDS}
+        if extra: row.extra = extra
+        return row
+
+    @classmethod
+    def coerce(cls, row): return row if isinstance(row, ScanRow) else cls.from_dict(row)
+
+    def to_dict(self): return dict(self.items())
+
+    def copy(self): return ScanRow(self.filename, self.timecode, self.type, self.status, self.source, dict(self.extra) if self.extra else None)
+
+    def keys(self): return [key for key, _ in self.items()]
+
+    def items(self):
+        for key, attr in self.ROW_FIELDS.items():
+            value = getattr(self, attr)
+            if value is not None: yield key, value
+        for field in SourceMedia.FIELDS:
+            value = self.source.legacy_value(field)
+            if value is not None: yield field, value
+        if self.extra: yield from self.extra.items()
+
+    def get(self, key, default=None):
+        attr = self.ROW_FIELDS.get(key)
+        if attr is not None: value = getattr(self, attr)
+        elif key in self.SOURCE_FIELDS: value = self.source.legacy_value(key)
+        else: value = self.extra.get(key) if self.extra else None
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None: raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        attr = self.ROW_FIELDS.get(key)
+        if attr is not None: setattr(self, attr, value)
+        elif key in self.SOURCE_FIELDS: self.source = self.source.replace(**{key: value})
+        else:
+            if self.extra is None: self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key): return self.get(key) is not None
+
+    def __iter__(self): return iter(self.keys())
+
+    def __eq__(self, other):
+        if not isinstance(other, ScanRow): return NotImplemented
+        return (self.filename, self.timecode, self.type, self.status, self.source, self.extra or None) == (other.filename, other.timecode, other.type, other.status, other.source, other.extra or None)
+
+    __hash__ = None
+
+    def __repr__(self): return f"ScanRow({self.to_dict()!r})"
+
+# --- Script Reading & Validation ---
+def print_log(message, status_type=None): print(message)
+
+def read_csv_rows(csv_path, log=print_log): return list(iter_csv_rows(csv_path, log))
+
+def iter_csv_rows(csv_path, log=print_log):
+    with open(csv_path, 'r', newline='', encoding='utf-8-sig') as f:
+        try: has_header = csv.Sniffer().has_header(f.read(2048)) 
+        except csv.Error: has_header = False
+        f.seek(0); use_fallback = False
+        if has_header:
+            reader = csv.DictReader(f)
+            def normalize(s): return s.lower().strip().replace(" ", "").replace("-", "")
+            field_map = {normalize(field): field for field in reader.fieldnames}
+            filename_header = next((field_map[k] for k in field_map if any(keyword in k for keyword in ['file', 'tên', 'tệp'])), None)
+            timecode_header = next((field_map[k] for k in field_map if any(keyword in k for keyword in ['time', 'inout', 'thờigian'])), None)
+            if filename_header and timecode_header:
+                log("Đã nhận diện cột filename và timecode từ header.")
+                for row in reader:
+                    if not row.get(filename_header) or row.get(filename_header) == filename_header: continue
+                    yield ScanRow(row[filename_header].replace('\n',' ').strip(), row[timecode_header].replace('\n',' ').strip())
+            else: log("Không nhận diện được cột từ header, chuyển sang chế độ dự phòng.", 'error'); use_fallback = True
+        if not has_header or use_fallback:
+            log("Đang đọc file theo thứ tự cột mặc định."); f.seek(0); reader = csv.reader(f)
+            for r in reader:
+                if len(r) >= 2 and r[0] and r[0] != 'filename': yield ScanRow(r[0].strip().replace('\n',' '), r[1].strip().replace('\n',' '))
+
+def needs_exact_duration(source, out_f):
+    duration = source.get('duration_frames', 0)
+    try: start_offset_frames = time_to_frames(source.get('start_timecode', '00:00:00:00'), source['framerate'])
+    except ValueError: start_offset_frames = 0
+    return duration <= 0 or out_f - start_offset_frames >= duration - DEEP_PROBE_MARGIN_FRAMES
+
+def apply_exact_duration(source, video_path, metadata, video_stream, metadata_cache=None, cache_variant='full'):
+    frame_count = count_video_frames(video_path)
+    if not frame_count: return
+    video_stream['nb_frames'] = str(frame_count); source['duration_frames'] = frame_count
+    if metadata_cache is not None: metadata_cache.put(video_path, metadata, cache_variant)
+
+def validate_row(row, find_file, probe, metadata_cache=None, cache_variant='full'):
+    row = ScanRow.coerce(row); source = {'codec': '', 'color_profile': 'N/A'}
+    with TRACER.span('scan.row', filename=row.filename): framerate = _validate_row_fields(row, source, find_file, probe, metadata_cache, cache_variant)
+    row.source = SourceMedia.shared(source); return row, framerate
+
+def _validate_row_fields(row, source, find_file, probe, metadata_cache=None, cache_variant='full'):
+    metadata = None; video_stream = None; duration_exact = False
+    filename = row.filename.strip(); row.status = 'ok'; framerate = None; row.type = ''
+    if not filename: row.status = 'skipped'; return framerate
+    video_path = find_file(filename)
+    if video_path is None: row.status = 'File not found'; return framerate
+    source['full_path'] = video_path; row.type = 'clip'
+    try:
+        metadata = probe(video_path)
+        if metadata and metadata.get('streams'):
+            video_stream = next((s for s in metadata['streams'] if s.get('codec_type') == 'video'), None)
+            source['audio_tracks'] = sum(1 for s in metadata.get('streams', []) if s.get('codec_type') == 'audio')
+            start_timecode_str = '00:00:00:00'
+            if video_stream and 'tags' in video_stream: start_timecode_str = next((v for k, v in video_stream['tags'].items() if 'timecode' in k.lower()), start_timecode_str)
+            if 'format' in metadata and 'tags' in metadata['format']: start_timecode_str = next((v for k, v in metadata['format']['tags'].items() if 'timecode' in k.lower()), start_timecode_str)
+            source['start_timecode'] = start_timecode_str
+            if video_stream:
+                source['codec'] = video_stream.get('codec_name', ''); source['width'] = video_stream.get('width', '1920'); source['height'] = video_stream.get('height', '1080')
+                color_transfer = video_stream.get('color_transfer'); color_space = video_stream.get('color_space'); color_primaries = video_stream.get('color_primaries')
+                if color_transfer and color_transfer not in ['unknown', 'bt709', 'smpte170m', 'bt470bg', 'bt601']: source['color_profile'] = color_transfer
+                elif (color_transfer in ['smpte170m', 'bt601']) or (color_space in ['smpte170m', 'bt601']): source['color_profile'] = 'Rec.601'
+                elif (color_transfer == 'bt709') or (color_space == 'bt709') or (color_primaries == 'bt709'): source['color_profile'] = 'Rec.709'
+                else: source['color_profile'] = 'N/A'
+            else: source['codec'] = Path(filename).suffix
+            if video_stream:
+                r_frame_rate = video_stream.get('r_frame_rate', '0/1')
+                try: num, den = map(float, r_frame_rate.split('/')); fps = num / den if den != 0 else 0
+                except (ValueError, ZeroDivisionError): fps = 0
+                if not fps or fps == 0: row.status = 'Invalid FPS (0)'; return framerate
+                source['framerate'] = float(f"{fps:.3f}"); framerate = round(fps, 3)
+                nb_frames = video_stream.get('nb_frames')
+                if nb_frames and int(nb_frames) > 0: source['duration_frames'] = int(nb_frames); duration_exact = True
+                elif 'duration' in video_stream: duration = float(video_stream.get('duration', '0')); source['duration_frames'] = int(duration * fps)
+                else: source['duration_frames'] = 0
+            else: row.type = 'title'; row.status = 'Cannot open media'; return framerate
+        else: source['codec'] = Path(filename).suffix; row.type = 'title'; row.status = 'Cannot open media'; return framerate
+    except Exception as e: row.type = 'title'; row.status = f'FFProbe Error: {e}'; return framerate
+    if row.status == 'ok' and row.type == 'clip':
+        try:
+            in_f, out_f = parse_inout(row.timecode, source.get('framerate', 25.0))
+            if in_f >= out_f: row.status = 'Out time < In time'
+        except (ValueError, TypeError):
+            row.status = 'Time format error'
+        if row.status == 'ok' and not duration_exact and needs_exact_duration(source, out_f): apply_exact_duration(source, video_path, metadata, video_stream, metadata_cache, cache_variant)
+    return framerate
+
+def make_shared_probe(probe):
+    probe_futures = {}; probe_lock = threading.Lock()
+    def probe_once(video_path):
+        key = os.path.normcase(os.path.abspath(video_path))
+        with probe_lock:
+            future = probe_futures.get(key); is_owner = future is None
+            if is_owner: future = probe_futures[key] = Future()
+        if is_owner:
+            try: future.set_result(probe(video_path))
+            except Exception as e: future.set_exception(e)
+        return future.result()
+    return probe_once
+
+def is_error_row(row): return row.status not in ['ok', 'skipped', 'gap'] and bool(row.filename)
+
+def mark_as_gap(row): row.type = 'gap'; row.status = 'gap'; return row
+
+# --- XML Building ---
+XML_ESCAPES = str.maketrans({'&': '&amp;', '<': '&lt;', '"': '&quot;', '>': '&gt;'})
+
+def write_pretty_element(write, elem, depth):
+    indent = "  " * depth; attrs = ''.join(f' {k}="{str(v).translate(XML_ESCAPES)}"' for k, v in elem.attrib.items()); children = list(elem)
+    if children:
+        write(f"{indent}<{elem.tag}{attrs}>\n")
+        for child in children: write_pretty_element(write, child, depth + 1)
+        write(f"{indent}</{elem.tag}>\n")
+    elif elem.text: write(f"{indent}<{elem.tag}{attrs}>{str(elem.text).translate(XML_ESCAPES)}</{elem.tag}>\n")
+    else: write(f"{indent}<{elem.tag}{attrs}/>\n")
+
+class XmemlWriter:
+    AUDIO_TRACK_COUNT = 8
+
+    def __init__(self, file_path, sequence_name, timeline_fps, width, height):
+        self.file_path = Path(file_path); self._tmp_path = self.file_path.with_name(self.file_path.name + ".tmp")
+        self._out = open(self._tmp_path, "w", encoding="utf-8"); self._audio_spools = [None] * self.AUDIO_TRACK_COUNT
+        timebase = str(round(timeline_fps)); name = str(sequence_name).translate(XML_ESCAPES)
+        self._out.write('<?xml version="1.0" ?>\n<xmeml version="4">\n  <sequence id="sequence-1">\n'
+                        f'    <name>{name}</name>\n    <rate>\n      <timebase>{timebase}</timebase>\n      <ntsc>FALSE</ntsc>\n    </rate>\n'
+                        '    <media>\n      <video>\n        <format>\n          <samplecharacteristics>\n'
+                        f'            <rate>\n              <timebase>{timebase}</timebase>\n            </rate>\n'
+                        f'            <width>{width}</width>\n            <height>{height}</height>\n            <pixelaspectratio>square</pixelaspectratio>\n'
+                        '          </samplecharacteristics>\n        </format>\n')
+        self._video_track_open = False; self._file_ids = {}
+
+    def add_event(self, event):
+        build_started_ns = time.perf_counter_ns(); clip_count = event.index; media = event.media; clip_name = event.name
+        start = str(event.record_in); end = str(event.record_out); in_frame = str(event.source_in); out_frame = str(event.source_out); file_id = self._file_ids.get(media.path)
+        if file_id is None: file_id = self._file_ids[media.path] = f"file_{clip_count}"; file_el = create_file_node(media, file_id)
+        else: file_el = ET.Element("file", id=file_id)
+        vid_clipitem = ET.Element("clipitem", id=f"vid_clip_{clip_count}"); ET.SubElement(vid_clipitem, "name").text = clip_name; ET.SubElement(vid_clipitem, "start").text = start; ET.SubElement(vid_clipitem, "end").text = end; ET.SubElement(vid_clipitem, "in").text = in_frame; ET.SubElement(vid_clipitem, "out").text = out_frame; vid_clipitem.append(file_el)
+        clip_group = [(vid_clipitem, 'video', 1)]; audio_clipitems = []
+        for j in range(min(media.audio_tracks, 8)):
+            aud_clipitem = ET.Element("clipitem", id=f"aud_clip_{clip_count}_{j+1}"); ET.SubElement(aud_clipitem, "name").text = clip_name; ET.SubElement(aud_clipitem, "start").text = start; ET.SubElement(aud_clipitem, "end").text = end; ET.SubElement(aud_clipitem, "in").text = in_frame; ET.SubElement(aud_clipitem, "out").text = out_frame; ET.SubElement(aud_clipitem, "file", id=file_id)
+            sourcetrack = ET.SubElement(aud_clipitem, "sourcetrack"); ET.SubElement(sourcetrack, "mediatype").text = "audio"; ET.SubElement(sourcetrack, "trackindex").text = str(j + 1); clip_group.append((aud_clipitem, 'audio', j + 1)); audio_clipitems.append((j, aud_clipitem))
+        link_clip_group(clip_group, clip_count); TRACER.record('xml.build', build_started_ns, time.perf_counter_ns()); self.add_clip(vid_clipitem, audio_clipitems)
+
+    def add_clip(self, vid_clipitem, audio_clipitems):
+        with TRACER.span('xml.serialize'): self._write_clip(vid_clipitem, audio_clipitems)
+
+    def _write_clip(self, vid_clipitem, audio_clipitems):
+        if not self._video_track_open: self._out.write("        <track>\n"); self._video_track_open = True
+        write_pretty_element(self._out.write, vid_clipitem, 5)
+        for track_index, aud_clipitem in audio_clipitems:
+            if self._audio_spools[track_index] is None: self._audio_spools[track_index] = tempfile.TemporaryFile("w+", encoding="utf-8")
+            write_pretty_element(self._audio_spools[track_index].write, aud_clipitem, 5)
+
+    def close(self, duration):
+        out = self._out
+        out.write("        </track>\n" if self._video_track_open else "        <track/>\n"); out.write("      </video>\n      <audio>\n")
+        for spool in self._audio_spools:
+            if spool is None: out.write("        <track/>\n"); continue
+            out.write("        <track>\n"); spool.seek(0); shutil.copyfileobj(spool, out); spool.close(); out.write("        </track>\n")
+        out.write(f"      </audio>\n    </media>\n    <duration>{duration}</duration>\n  </sequence>\n</xmeml>\n"); out.close()
+        os.replace(self._tmp_path, self.file_path)
+
+    def abort(self):
+        for spool in self._audio_spools:
+            if spool is not None: spool.close()
+        self._out.close()
+        try: self._tmp_path.unlink()
+        except OSError: pass
+
+def create_file_node(media, file_id):
+    source_fps = media.fps
+    file_el = ET.Element("file", id=file_id); ET.SubElement(file_el, "name").text = media.name; formatted_uri = media.uri.replace('file:///', 'file://localhost/').replace(':', '%3a', 1); ET.SubElement(file_el, "pathurl").text = formatted_uri; ET.SubElement(file_el, "duration").text = str(media.duration_frames)
+    timecode_el = ET.SubElement(file_el, "timecode"); tc_rate = ET.SubElement(timecode_el, "rate"); ET.SubElement(tc_rate, "timebase").text = str(round(source_fps)); is_ntsc = media.is_ntsc; ET.SubElement(tc_rate, "ntsc").text = "TRUE" if is_ntsc else "FALSE"; ET.SubElement(timecode_el, "string").text = media.start_timecode; ET.SubElement(timecode_el, "frame").text = str(int(media.start_frame)); ET.SubElement(timecode_el, "displayformat").text = "DF" if is_ntsc else "NDF"
+    media_el = ET.SubElement(file_el, "media"); vid_media_el = ET.SubElement(media_el, "video"); vid_sample_chars = ET.SubElement(vid_media_el, "samplecharacteristics"); rate_el = ET.SubElement(vid_sample_chars, "rate"); ET.SubElement(rate_el, "timebase").text = str(round(source_fps)); ET.SubElement(vid_sample_chars, "width").text = str(media.width); ET.SubElement(vid_sample_chars, "height").text = str(media.height)
+    aud_media_el = ET.SubElement(media_el, "audio"); ET.SubElement(aud_media_el, "channelcount").text = str(media.audio_tracks) if media.audio_tracks > 0 else "2"
+    return file_el
+
+def link_clip_group(clip_group, clip_count):
+    for source_item, _, _ in clip_group:
+        for target_item, target_type, target_track_idx in clip_group:
+            link = ET.SubElement(source_item, "link"); ET.SubElement(link, "linkclipref").text = target_item.get("id"); ET.SubElement(link, "mediatype").text = target_type; ET.SubElement(link, "trackindex").text = str(target_track_idx); ET.SubElement(link, "clipindex").text = str(clip_count)
+            if source_item.get("id") != target_item.get("id"): ET.SubElement(link, "groupindex").text = "1"
+
+# --- Timeline Model & Exporters ---
+class TimelineMedia:
+    __slots__ = ('path', 'name', 'uri', 'fps', 'duration_frames', 'start_timecode', 'start_frame', 'audio_tracks', 'width', 'height')
+
+    def __init__(self, source):
+        video_path = Path(source.full_path); self.path = str(video_path); self.name = video_path.name; self.uri = video_path.as_uri()
+        self.fps = source.framerate; self.duration_frames = source.duration_frames or 0
+        self.start_timecode = source.start_timecode or '00:00:00:00'; self.start_frame = source.start_frame
+        self.audio_tracks = source.audio_tracks or 0; self.width = 1920 if source.width is None else source.width; self.height = 1080 if source.height is None else source.height
+
+    @property
+    def is_ntsc(self): return '29.97' in str(self.fps) or '59.94' in str(self.fps)
+
+class TimelineEvent:
+    __slots__ = ('record_in', 'duration', 'media', 'name', 'index', 'source_in', 'source_out')
+
+    def __init__(self, record_in, duration, media=None, name='', index=0, source_in=0, source_out=0):
+        self.record_in = record_in; self.duration = duration; self.media = media; self.name = name; self.index = index; self.source_in = source_in; self.source_out = source_out
+
+    @property
+    def is_gap(self): return self.media is None
+
+    @property
+    def record_out(self): return self.record_in + self.duration
+
+class Timeline:
+    __slots__ = ('fps', 'events', 'media', 'duration', 'clip_count', 'checkpoints')
+
+    def __init__(self, fps): self.fps = fps; self.events = []; self.media = {}; self.duration = 0; self.clip_count = 0; self.checkpoints = []
+
+    def clips(self): return (event for event in self.events if not event.is_gap)
+
+class TimelineBuilder:
+    def __init__(self, timeline_fps, log=print_log, on_clip=None):
+        self.timeline = Timeline(timeline_fps); self.position = 0; self.log = log; self.on_clip = on_clip
+
+    def resume(self, previous, start_row):
+        timeline = self.timeline; events = timeline.events
+        event_count, self.position, timeline.clip_count = previous.checkpoints[start_row] if start_row < len(previous.checkpoints) else (len(previous.events), previous.duration, previous.clip_count)
+        events.extend(previous.events[:event_count]); timeline.checkpoints.extend(previous.checkpoints[:start_row])
+        kept_media = {id(event.media) for event in events if event.media is not None}; timeline.media.update((path, media) for path, media in previous.media.items() if id(media) in kept_media)
+
+    def add(self, row):
+        timeline = self.timeline; timeline_fps = timeline.fps; events = timeline.events; position = self.position
+        timeline.checkpoints.append((len(events), position, timeline.clip_count))
+        if row.type == 'gap' and row.status == 'gap':
+            try: in_f, out_f = parse_inout(row.timecode, timeline_fps)
+            except Exception: return
+            if out_f - in_f > 0: events.append(TimelineEvent(position, out_f - in_f)); self.position += out_f - in_f
+            return
+        if row.status != 'ok' or row.type != 'clip': return
+        source = row.source
+        try:
+            source_fps = source.framerate; in_frame_raw, out_frame_raw = parse_inout(row.timecode, source_fps); start_offset_frames = source.start_frame
+            in_frame = max(0, in_frame_raw - start_offset_frames); out_frame = min(source.duration_frames or 0, out_frame_raw - start_offset_frames)
+            if in_frame >= out_frame: return
+            duration = round((out_frame - in_frame) * (timeline_fps / source_fps))
+            if duration <= 0: return
+            media = timeline.media.get(source.full_path)
+            if media is None: media = timeline.media[source.full_path] = TimelineMedia(source)
+            timeline.clip_count += 1
+            event = TimelineEvent(position, duration, media, row.filename.strip(), timeline.clip_count, in_frame, out_frame); events.append(event); self.position += duration
+        except (ValueError, TypeError, KeyError) as e: self.log(f"Lỗi xử lý dòng cho clip '{row.filename}': {e}. Bỏ qua.", 'error'); return
+        if self.on_clip is not None: self.on_clip(event)
+
+    def finish(self): self.timeline.duration = self.position; return self.timeline
+
+def build_timeline(processed_data, timeline_fps, log=print_log, progress=None, previous=None, first_changed_row=0):
+    builder = TimelineBuilder(timeline_fps, log); add = builder.add; start_row = 0
+    if previous is not None and previous.fps == timeline_fps and first_changed_row > 0:
+        start_row = min(first_changed_row, len(previous.checkpoints), len(processed_data)); builder.resume(previous, start_row)
+        if progress is not None and start_row: progress.advance(start_row)
+    with TRACER.span('timeline.build', rows=len(processed_data) - start_row, reused=start_row):
+        for row in processed_data[start_row:]:
+            if progress is not None: progress.advance(1)
+            add(row)
+    return builder.finish()
+
+def export_xmeml(timeline, file_path, sequence_name, width, height):
+    writer = XmemlWriter(file_path, sequence_name, timeline.fps, width, height)
+    try:
+        for event in timeline.clips(): writer.add_event(event)
+    except BaseException: writer.abort(); raise
+    with TRACER.span('xml.finalize'): writer.close(timeline.duration)
+
+def _frame_duration(fps):
+    from fractions import Fraction
+    nominal = round(float(fps))
+    if nominal and abs(float(fps) - nominal * 1000 / 1001) < 0.005: return Fraction(1001, nominal * 1000)
+    return 1 / Fraction(str(float(fps))).limit_denominator(1000)
+
+def _fcpx_time(frames, fps):
+    value = _frame_duration(fps) * int(round(frames))
+    return f"{value.numerator}/{value.denominator}s" if value.denominator != 1 else f"{value.numerator}s"
+
+def export_fcpxml(timeline, file_path, sequence_name, width, height):
+    formats = {}; assets = {}; escape = lambda value: str(value).translate(XML_ESCAPES)
+    def format_id(fps, format_width, format_height):
+        key = (float(fps), str(format_width), str(format_height))
+        if key not in formats: formats[key] = f"r{len(formats) + 1}"
+        return formats[key]
+    sequence_format = format_id(timeline.fps, width, height)
+    for media in timeline.media.values():
+        asset_format = format_id(media.fps, media.width, media.height); assets[media.path] = (f"a{len(assets) + 1}", asset_format)
+    tmp_path = Path(str(file_path) + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as out:
+        out.write('<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE fcpxml>\n<fcpxml version="1.9">\n  <resources>\n')
+        for (fps, format_width, format_height), resource_id in formats.items(): out.write(f'    <format id="{resource_id}" frameDuration="{_fcpx_time(1, fps)}" width="{format_width}" height="{format_height}"/>\n')
+        for media in timeline.media.values():
+            asset_id, asset_format = assets[media.path]
+            out.write(f'    <asset id="{asset_id}" name="{escape(media.name)}" start="{_fcpx_time(media.start_frame, media.fps)}" duration="{_fcpx_time(media.duration_frames, media.fps)}" hasVideo="1" hasAudio="{1 if media.audio_tracks else 0}" format="{asset_format}" audioSources="1" audioChannels="{media.audio_tracks or 2}">\n'
+                      f'      <media-rep kind="original-media" src="{escape(media.uri)}"/>\n    </asset>\n')
+        tc_format = "DF" if round(float(timeline.fps), 2) in DROP_FRAME_RATES else "NDF"
+        out.write(f'  </resources>\n  <library>\n    <event name="{escape(sequence_name)}">\n      <project name="{escape(sequence_name)}">\n'
+                  f'        <sequence format="{sequence_format}" duration="{_fcpx_time(timeline.duration, timeline.fps)}" tcStart="0s" tcFormat="{tc_format}">\n          <spine>\n')
+        for event in timeline.events:
+            offset = _fcpx_time(event.record_in, timeline.fps); duration = _fcpx_time(event.duration, timeline.fps)
+            if event.is_gap: out.write(f'            <gap name="Gap" offset="{offset}" start="0s" duration="{duration}"/>\n'); continue
+            asset_id, asset_format = assets[event.media.path]; start = _fcpx_time(event.media.start_frame + event.source_in, event.media.fps)
+            out.write(f'            <asset-clip ref="{asset_id}" name="{escape(event.name)}" offset="{offset}" start="{start}" duration="{duration}" format="{asset_format}" tcFormat="{tc_format}"/>\n')
+        out.write('          </spine>\n        </sequence>\n      </project>\n    </event>\n  </library>\n</fcpxml>\n')
+    os.replace(tmp_path, file_path)
+
+def export_edl(timeline, file_path, sequence_name, width, height):
+    drop_frame = round(float(timeline.fps), 2) in DROP_FRAME_RATES; tmp_path = Path(str(file_path) + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8', newline='\r\n') as out:
+        out.write(f"TITLE: {sequence_name}\nFCM: {'DROP FRAME' if drop_frame else 'NON-DROP FRAME'}\n\n")
+        for event_number, event in enumerate(timeline.clips(), 1):
+            media = event.media; source_in = media.start_frame + event.source_in; source_out = source_in + (event.source_out - event.source_in)
+            out.write(f"{event_number:03d}  AX       {'AA/V' if media.audio_tracks else 'V   '}  C        "
+                      f"{frames_to_timecode(source_in, media.fps)} {frames_to_timecode(source_out, media.fps)} {frames_to_timecode(event.record_in, timeline.fps)} {frames_to_timecode(event.record_out, timeline.fps)}\n"
+                      f"* FROM CLIP NAME: {event.name}\n* SOURCE FILE: {media.path}\n\n")
+    os.replace(tmp_path, file_path)
+
+def _otio_range(start, duration, rate):
+    return {'OTIO_SCHEMA': 'TimeRange.1', 'start_time': {'OTIO_SCHEMA': 'RationalTime.1', 'rate': float(rate), 'value': float(start)}, 'duration': {'OTIO_SCHEMA': 'RationalTime.1', 'rate': float(rate), 'value': float(duration)}}
+
+def _otio_item(event, timeline_fps, with_media):
+    if event.is_gap or not with_media: return {'OTIO_SCHEMA': 'Gap.1', 'name': '', 'source_range': _otio_range(0, event.duration, timeline_fps), 'effects': [], 'markers': [], 'enabled': True, 'metadata': {}}
+    media = event.media
+    reference = {'OTIO_SCHEMA': 'ExternalReference.1', 'name': media.name, 'target_url': media.uri, 'available_range': _otio_range(media.start_frame, media.duration_frames, media.fps), 'available_image_bounds': None, 'metadata': {}}
+    return {'OTIO_SCHEMA': 'Clip.2', 'name': event.name, 'source_range': _otio_range(media.start_frame + event.source_in, event.source_out - event.source_in, media.fps), 'media_references': {'DEFAULT_MEDIA': reference}, 'active_media_reference_key': 'DEFAULT_MEDIA', 'effects': [], 'markers': [], 'enabled': True, 'metadata': {}}
+
+def export_otio(timeline, file_path, sequence_name, width, height):
+    tmp_path = Path(str(file_path) + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as out:
+        out.write('{"OTIO_SCHEMA": "Timeline.1", "name": ' + json.dumps(sequence_name, ensure_ascii=False) + ', "global_start_time": null, "metadata": {"snipsnip": {"width": ' + json.dumps(str(width)) + ', "height": ' + json.dumps(str(height)) + '}}, "tracks": {"OTIO_SCHEMA": "Stack.1", "name": "tracks", "source_range": null, "effects": [], "markers": [], "enabled": true, "metadata": {}, "children": [')
+        for track_number, (track_name, kind) in enumerate((('V1', 'Video'), ('A1', 'Audio'))):
+            out.write((', ' if track_number else '') + '{"OTIO_SCHEMA": "Track.1", "name": "' + track_name + '", "kind": "' + kind + '", "source_range": null, "effects": [], "markers": [], "enabled": true, "metadata": {}, "children": [')
+            for item_number, event in enumerate(timeline.events):
+                with_media = kind == 'Video' or (not event.is_gap and event.media.audio_tracks > 0)
+                out.write((', ' if item_number else '') + json.dumps(_otio_item(event, timeline.fps, with_media), ensure_ascii=False))
+            out.write(']}')
+        out.write(']}}\n')
+    os.replace(tmp_path, file_path)
+
+EXPORTERS = {'xmeml': (export_xmeml, '.xml'), 'fcpxml': (export_fcpxml, '.fcpxml'), 'edl': (export_edl, '.edl'), 'otio': (export_otio, '.otio')}
+
+def export_timeline(timeline, xml_path, sequence_name, width, height, formats=('xmeml',)):
+    written = []; xml_path = Path(xml_path)
+    for export_format in formats:
+        exporter, extension = EXPORTERS[export_format]; target = xml_path if export_format == 'xmeml' else xml_path.with_suffix(extension)
+        with TRACER.span(f'export.{export_format}', path=target): exporter(timeline, target, sequence_name, width, height)
+        written.append(target)
+    return written
+
+def write_sequence_xml(processed_data, file_path, sequence_name, timeline_fps, width, height, log=print_log, progress=None):
+    with TRACER.span('xml.write', path=file_path):
+        timeline = build_timeline(processed_data, timeline_fps, log, progress); export_xmeml(timeline, file_path, sequence_name, width, height)
+    return timeline.clip_count
+
+# --- Pipelined Scan & Generate ---
+PIPELINE_WINDOW_PER_WORKER = 4
+
+def run_scan_pipeline(rows, resolve, timeline_fps, workers, log=print_log, progress=None, on_clip=None):
+    processed = []; framerates = []; in_flight = deque(); window = max(1, workers) * PIPELINE_WINDOW_PER_WORKER
+    builder = None if timeline_fps == 'auto' else TimelineBuilder(timeline_fps, log, on_clip)
+    def commit(future):
+        row, framerate = future.result()
+        if is_error_row(row): mark_as_gap(row)
+        processed.append(row)
+        if framerate: framerates.append(framerate)
+        if builder is not None: builder.add(row)
+    with TRACER.span('pipeline.scan'), ThreadPoolExecutor(max_workers=workers) as pool:
+        for row in rows:
+            if progress is not None: progress.total += 1
+            in_flight.append(pool.submit(resolve, row))
+            while in_flight and (in_flight[0].done() or len(in_flight) >= window): commit(in_flight.popleft())
+        while in_flight: commit(in_flight.popleft())
+    if builder is None:
+        timeline_fps = Counter(framerates).most_common(1)[0][0] if framerates else 25.0; builder = TimelineBuilder(timeline_fps, log, on_clip)
+        with TRACER.span('timeline.build', rows=len(processed)):
+            for row in processed: builder.add(row)
+    return processed, framerates, builder.finish()
+
+# --- Media Fetching ---
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+FETCH_WORKERS = 4
+KERNEL_COPY_FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EBADF}
+
+def _copy_descriptor_range(fsrc, fdest, offset, total_size, progress=None):
+    src_fd = fsrc.fileno(); dest_fd = fdest.fileno()
+    for method in ('copy_file_range', 'sendfile'):
+        if not hasattr(os, method): continue
+        try:
+            while offset < total_size:
+                count = min(COPY_CHUNK_SIZE, total_size - offset)
+                if method == 'copy_file_range': sent = os.copy_file_range(src_fd, dest_fd, count, offset, offset)
+                else: os.lseek(dest_fd, offset, os.SEEK_SET); sent = os.sendfile(dest_fd, src_fd, offset, count)
+                if not sent: break
+                offset += sent
+                if progress is not None: progress.advance(sent)
+            return offset
+        except OSError as e:
+            if e.errno not in KERNEL_COPY_FALLBACK_ERRNOS: raise
+    fsrc.seek(offset); fdest.seek(offset)
+    while True:
+        chunk = fsrc.read(COPY_CHUNK_SIZE)
+        if not chunk: break
+        fdest.write(chunk); offset += len(chunk)
+        if progress is not None: progress.advance(len(chunk))
+    return offset
+
+def copy_file_fast(src, dest, progress=None):
+    src = Path(src); dest = Path(dest); part_path = dest.with_name(dest.name + '.part'); source_path = dest.with_name(dest.name + '.part.src')
+    src_stat = src.stat(); total_size = src_stat.st_size; source_id = f"{os.path.abspath(src)}|{total_size}|{src_stat.st_mtime_ns}"
+    if dest.exists() and dest.stat().st_size == total_size:
+        if progress is not None: progress.advance(total_size)
+        return dest
+    try: resumable = source_path.read_text(encoding='utf-8') == source_id
+    except OSError: resumable = False
+    offset = part_path.stat().st_size if resumable and part_path.exists() else 0
+    if offset > total_size: offset = 0
+    if not offset: source_path.write_text(source_id, encoding='utf-8')
+    if progress is not None and offset: progress.advance(offset)
+    with open(src, 'rb') as fsrc, open(part_path, 'r+b' if offset else 'wb') as fdest:
+        _copy_descriptor_range(fsrc, fdest, offset, total_size, progress)
+    copied_size = part_path.stat().st_size
+    if copied_size != total_size: raise OSError(f"Kích thước không khớp sau khi chép '{src.name}': {copied_size} / {total_size} bytes")
+    os.replace(part_path, dest)
+    with contextlib.suppress(OSError): source_path.unlink()
+    return dest
+
+# --- Google Sheet Import ---
+GOOGLE_SHEETS_BASE_URL = 'https://docs.google.com'
+SHEET_URL_RE = re.compile(r'/spreadsheets/d/([a-zA-Z0-9-_]+)')
+SHEET_GID_RE = re.compile(r'gid=([0-9]+)')
+
+def parse_google_sheet_links(text):
+    sheets = []
+    for token in re.split(r'[\s,;]+', text or ''):
+        match = SHEET_URL_RE.search(token)
+        if not match: continue
+        for gid in SHEET_GID_RE.findall(token):
+            if (match.group(1), gid) not in sheets: sheets.append((match.group(1), gid))
+    if not sheets: raise ValueError("Link Google Sheet không hợp lệ hoặc không chứa GID.")
+    return sheets
+
+VIDEO_FILENAME_RE = re.compile(r'\.(?:mp4|mov|mxf|mts|avi|wmv|flv|webm)\Z', re.IGNORECASE)
+SHEET_TIMECODE_SEGMENT_RE = re.compile(r'(?:\d{1,2}:)?\d{1,2}:\d{2}\s*-\s*(?:\d{1,2}:)?\d{1,2}:\d{2}')
+SHEET_COLON_PAIR_RE = re.compile(r'(\d{1,2}:\d{2}):(\d{1,2}:\d{2})')
+SHEET_PAREN_NOTE_RE = re.compile(r'\(.*?\)')
+
+def iter_google_sheet_rows(raw_data, skipped_rows_info=None):
+    if skipped_rows_info is None: skipped_rows_info = []
+    reader = csv.reader(io.TextIOWrapper(io.BytesIO(raw_data), encoding='utf-8', errors='ignore', newline=''))
+    for row_num, row in enumerate(reader, 1):
+        if any('(BỎ)' in str(cell).upper() for cell in row): skipped_rows_info.append({'row_index': row_num, 'raw_row': ','.join(row), 'reason': 'Chứa từ khóa "(BỎ)"'}); continue
+        if len(row) < 5: skipped_rows_info.append({'row_index': row_num, 'raw_row': ','.join(row), 'reason': 'Dòng quá ngắn để chứa dữ liệu hợp lệ'}); continue
+        filename = None; timecode = None
+        for cell in row:
+            cell = str(cell).strip()
+            if filename is None and VIDEO_FILENAME_RE.search(cell): filename = cell
+            if timecode is None:
+                candidate = cell.replace('\n', ' '); colon_pair = SHEET_COLON_PAIR_RE.match(candidate)
+                if colon_pair: candidate = f"{colon_pair.group(1)}-{colon_pair.group(2)}"
+                if SHEET_TIMECODE_SEGMENT_RE.search(candidate): timecode = candidate
+            if filename is not None and timecode is not None: break
+        if filename is None or timecode is None: continue
+        segments = SHEET_TIMECODE_SEGMENT_RE.findall(SHEET_PAREN_NOTE_RE.sub('', timecode).strip())
+        if not segments: skipped_rows_info.append({'row_index': row_num, 'raw_row': ','.join(row), 'reason': 'Timecode không hợp lệ sau khi làm sạch'}); continue
+        for segment in segments: yield ScanRow(filename, segment.strip())
+
+class SheetFetcher:
+    def __init__(self, cache_dir, base_url=GOOGLE_SHEETS_BASE_URL, timeout=15, retries=3, backoff=0.5, max_workers=4):
+        self.cache_dir = Path(cache_dir); self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.base_url = base_url.rstrip('/'); self.timeout = timeout; self.retries = retries; self.backoff = backoff; self.max_workers = max_workers
+
+    def export_url(self, sheet_id, gid): return f'{self.base_url}/spreadsheets/d/{sheet_id}/export?format=csv&gid={gid}'
+
+    def _cache_paths(self, url):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()[:20]
+        return self.cache_dir / f"{key}.csv", self.cache_dir / f"{key}.json"
+
+    def fetch(self, sheet_id, gid):
+        import urllib.request, urllib.error
+        url = self.export_url(sheet_id, gid); body_path, meta_path = self._cache_paths(url); headers = {}
+        try: meta = json.loads(meta_path.read_text(encoding='utf-8')) if body_path.exists() else {}
+        except (OSError, ValueError): meta = {}
+        if meta.get('etag'): headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'): headers['If-Modified-Since'] = meta['last_modified']
+        for attempt in range(self.retries + 1):
+            try:
+                with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=self.timeout) as response:
+                    if response.getcode() != 200: raise Exception(f"Lỗi máy chủ: {response.getcode()}")
+                    raw_data = response.read(); etag = response.headers.get('ETag'); last_modified = response.headers.get('Last-Modified')
+                break
+            except urllib.error.HTTPError as e:
+                if e.code == 304: return body_path.read_bytes(), True
+                if (e.code < 500 and e.code != 429) or attempt == self.retries: raise Exception(f"Lỗi máy chủ: {e.code} (gid={gid})")
+            except (urllib.error.URLError, TimeoutError, ConnectionError) as e:
+                if attempt == self.retries: raise Exception(f"Không thể kết nối tới Google Sheet (gid={gid}): {getattr(e, 'reason', e)}")
+            time.sleep(self.backoff * (2 ** attempt))
+        if etag or last_modified:
+            tmp_path = body_path.with_suffix('.tmp'); tmp_path.write_bytes(raw_data); os.replace(tmp_path, body_path)
+            meta_path.write_text(json.dumps({'url': url, 'etag': etag, 'last_modified': last_modified}), encoding='utf-8')
+        return raw_data, False
+
+    def fetch_many(self, sheets):
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(sheets)))) as pool:
+            return list(pool.map(lambda sheet: self.fetch(*sheet), sheets))
+
+# --- Poster-frame Thumbnails ---
+THUMBNAIL_SIZE = (160, 90)
+THUMBNAIL_PREFETCH_DELAY_MS = 250
+
+def extract_poster_frame(video_path, seconds, out_path, size=THUMBNAIL_SIZE):
+    width, height = size
+    command = ['ffmpeg', '-v', 'error', '-nostdin', '-y', '-ss', f"{seconds:.3f}", '-i', str(video_path), '-frames:v', '1', '-vf', f"scale={width}:{height}:force_original_aspect_ratio=decrease,pad={width}:{height}:(ow-iw)/2:(oh-ih)/2", '-f', 'image2', '-update', '1', '-c:v', 'png', str(out_path)]
+    with TRACER.span('ffmpeg.thumbnail', path=video_path): subprocess.run(command, capture_output=True, check=True, timeout=30)
+    return os.path.getsize(out_path) > 0
+
+class ThumbnailCache:
+    """PNG poster frames on disk, keyed by file fingerprint and frame, extracted by at most `max_workers` ffmpeg processes and trimmed oldest-first to `max_bytes`."""
+    def __init__(self, cache_dir, max_bytes=256 * 1024 * 1024, max_workers=2):
+        self.cache_dir = Path(cache_dir); self.cache_dir.mkdir(parents=True, exist_ok=True); self.max_bytes = max_bytes; self.available = True
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='thumbnail'); self._lock = threading.Lock(); self._pending = {}; self._total_bytes = None
+
+    def path_for(self, video_path, frame, fps, size):
+        st = os.stat(video_path); key = f"{os.path.abspath(video_path)}|{st.st_size}|{st.st_mtime_ns}|{frame}|{fps}|{size[0]}x{size[1]}"
+        return self.cache_dir / f"{hashlib.sha1(key.encode('utf-8')).hexdigest()}.png"
+
+    def request(self, video_path, frame, fps, callback, size=THUMBNAIL_SIZE):
+        """callback(path) runs on the calling thread for cache hits and on a worker thread otherwise; path is None when no frame could be extracted."""
+        try: target = self.path_for(video_path, frame, fps, size)
+        except OSError: callback(None); return
+        if target.exists():
+            with contextlib.suppress(OSError): os.utime(target)
+            callback(target); return
+        if not self.available: callback(None); return
+        with self._lock:
+            future = self._pending.get(target)
+            if future is None: future = self._pending[target] = self._pool.submit(self._extract, video_path, frame / fps, target, size)
+        future.add_done_callback(lambda done: callback(None if done.cancelled() else done.result()))
+
+    def prefetch(self, video_path, frame, fps, size=THUMBNAIL_SIZE):
+        try: target = self.path_for(video_path, frame, fps, size)
+        except OSError: return None
+        if not self.available or target.exists(): return target
+        with self._lock:
+            if target not in self._pending: self._pending[target] = self._pool.submit(self._extract, video_path, frame / fps, target, size)
+        return target
+
+    def _extract(self, video_path, seconds, target, size):
+        partial = target.with_suffix('.tmp')
+        try:
+            if not extract_poster_frame(video_path, seconds, partial, size): return None
+            os.replace(partial, target); self._account(target.stat().st_size); return target
+        except FileNotFoundError: self.available = False; return None
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError): return None
+        finally:
+            with contextlib.suppress(OSError): partial.unlink()
+            with self._lock: self._pending.pop(target, None)
+
+    def _account(self, added_bytes):
+        with self._lock:
+            if self._total_bytes is None: self._total_bytes = sum(entry.stat().st_size for entry in os.scandir(self.cache_dir) if entry.name.endswith('.png'))
+            else: self._total_bytes += added_bytes
+            if self._total_bytes > self.max_bytes: self._total_bytes = self._evict(self.max_bytes * 9 // 10)
+
+    def _evict(self, target_bytes):
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith('.png'): continue
+            with contextlib.suppress(OSError): st = entry.stat(); entries.append((st.st_mtime, st.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= target_bytes: break
+            with contextlib.suppress(OSError): os.remove(path); total -= size
+        return total
+
+    def cancel_pending(self, keep=()):
+        with self._lock:
+            for target, future in list(self._pending.items()):
+                if target not in keep and future.cancel(): del self._pending[target]
+
+    def close(self): self._pool.shutdown(wait=False, cancel_futures=True)
+
+# --- Watch Mode ---
+class FileWatcher:
+    """Polls a signature callable and fires on_change once it has stayed unchanged for `debounce` seconds."""
+    def __init__(self, signature, on_change, interval=1.0, debounce=2.0, initial=True):
+        self.signature = signature; self.on_change = on_change; self.interval = interval; self.debounce = debounce; self.initial = initial
+        self._stop = threading.Event(); self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self): self._thread.start(); return self
+
+    def stop(self): self._stop.set()
+
+    @property
+    def running(self): return self._thread.is_alive() and not self._stop.is_set()
+
+    def _run(self):
+        built = pending = None; settled_at = 0.0; first = True
+        while not self._stop.is_set():
+            try: current = self.signature()
+            except Exception: current = None
+            if first and not self.initial: built = pending = current; first = False
+            if first or current != built:
+                now = time.monotonic()
+                if first: settled_at = now
+                elif current != pending: pending = current; settled_at = now + self.debounce
+                if now >= settled_at: built = pending = current; first = False; self.on_change()
+            else: pending = built
+            self._stop.wait(self.interval)
 
 # --- Custom Dialogs ---
-class ErrorEditorDialog(ctk.CTkToplevel):
+class ErrorEditorDialog(ctk.CTkToplevel if ctk else object):
     def __init__(self, parent, error_rows):
         super().__init__(parent)
         self.parent = parent
         self.error_rows_with_indices = error_rows
         self.current_error_index = 0
-        self.title("Sửa lỗi dữ liệu CSV"); self.geometry("600x400"); self.resizable(False, False); self.transient(parent); self.lift(); self.focus_force()
+        self.title("Sửa lỗi dữ liệu CSV"); self.geometry("800x540"); self.resizable(False, False); self.transient(parent); self.lift(); self.focus_force()
         self.info_label = ctk.CTkLabel(self, text="", justify="left", font=("Consolas", 12)); self.info_label.pack(pady=10, padx=20, fill="x")
+        self._blank_thumbnail = tk.PhotoImage(width=THUMBNAIL_SIZE[0], height=THUMBNAIL_SIZE[1]); self._thumbnail_token = 0
+        self.thumbnail_label = tk.Label(self, image=self._blank_thumbnail, borderwidth=0, highlightthickness=0); self.thumbnail_label.pack(pady=(0, 5))
         self.filename_entry = ctk.CTkEntry(self, width=560); self.filename_entry.pack(pady=5, padx=20, fill="x")
+        self.suggestion_frame = ctk.CTkFrame(self, fg_color="transparent"); self.suggestion_frame.pack(pady=(0, 5), padx=20, fill="x")
         self.timecode_entry = ctk.CTkEntry(self, width=560); self.timecode_entry.pack(pady=5, padx=20, fill="x")
         self.status_label = ctk.CTkLabel(self, text="", text_color="gray"); self.status_label.pack(pady=5, padx=20)
         self.progress_label = ctk.CTkLabel(self, text=""); self.progress_label.pack(pady=(5, 0), padx=20)
         self.progress_bar = ctk.CTkProgressBar(self, width=560); self.progress_bar.set(0); self.progress_bar.pack_forget()
         self.button_frame = ctk.CTkFrame(self, fg_color="transparent"); self.button_frame.pack(pady=10)
         self.find_copy_button = ctk.CTkButton(self.button_frame, text="Tìm & Chép File...", command=self.find_and_copy_file)
+        self.fetch_all_button = ctk.CTkButton(self.button_frame, text="Tìm & Chép Tất Cả...", command=self.fetch_all_missing)
         self.create_gap_button = ctk.CTkButton(self.button_frame, text="Tạo Gap & Tiếp", command=self.create_gap)
+        self.accept_all_button = ctk.CTkButton(self.button_frame, text="Nhận mọi gợi ý chắc chắn", command=self.accept_high_confidence_matches)
         self.save_button = ctk.CTkButton(self.button_frame, text="Lưu & Kiểm tra lại", command=self.save_and_recheck)
         self.skip_button = ctk.CTkButton(self.button_frame, text="Bỏ qua ->", command=self.next_error)
         self.finish_button = ctk.CTkButton(self.button_frame, text="Gap Tất Cả & Đóng", command=self.close_and_process_remaining)
         self.protocol("WM_DELETE_WINDOW", self.destroy)
+        self.fuzzy_index = None; threading.Thread(target=self._build_fuzzy_index, daemon=True).start()
         self.load_current_error()
+    def _build_fuzzy_index(self):
+        fuzzy_index = FuzzyNameIndex(self.parent._get_media_index().paths()); self.after(0, self._on_fuzzy_index_ready, fuzzy_index)
+    def _on_fuzzy_index_ready(self, fuzzy_index):
+        self.fuzzy_index = fuzzy_index
+        if self.current_error_index < len(self.error_rows_with_indices): self._show_suggestions()
+    def _show_suggestions(self):
+        for widget in self.suggestion_frame.winfo_children(): widget.destroy()
+        original_index, _ = self.error_rows_with_indices[self.current_error_index]; row = self.parent.processed_data[original_index]
+        if row.get('status') != 'File not found': return
+        if self.fuzzy_index is None: ctk.CTkLabel(self.suggestion_frame, text="Đang tìm gợi ý tên file...", text_color="gray").pack(side="left"); return
+        suggestions = self.fuzzy_index.suggest(row.get('filename', ''))
+        if not suggestions: ctk.CTkLabel(self.suggestion_frame, text="Không có gợi ý nào.", text_color="gray").pack(side="left"); return
+        ctk.CTkLabel(self.suggestion_frame, text="Gợi ý:").pack(side="left", padx=(0, 5))
+        for name, score in suggestions: ctk.CTkButton(self.suggestion_frame, text=f"{name} ({score:.0%})", width=60, fg_color="transparent", border_width=1, command=lambda name=name: self.apply_suggestion(name)).pack(side="left", padx=3)
+        suggested_path = self.parent._get_media_index().find(suggestions[0][0])
+        if suggested_path: self._request_thumbnail(ScanRow(suggestions[0][0], row.timecode, source=SourceMedia.shared({'full_path': suggested_path})))
+    def _request_thumbnail(self, row):
+        self._thumbnail_token += 1; token = self._thumbnail_token; self.thumbnail_label.configure(image=self._blank_thumbnail)
+        poster = self.parent._poster_frame(row)
+        if poster: self.parent.thumbnail_cache.request(*poster, callback=lambda path: self.parent.after(0, self._on_thumbnail_ready, token, path))
+    def _on_thumbnail_ready(self, token, path):
+        if path is None or token != self._thumbnail_token or not self.winfo_exists(): return
+        image = self.parent._load_thumbnail_image(path)
+        if image is not None: self.thumbnail_label.configure(image=image)
+    def apply_suggestion(self, name):
+        self.filename_entry.delete(0, "end"); self.filename_entry.insert(0, name); self.save_and_recheck()
     def load_current_error(self, event=None):
         if self.current_error_index >= len(self.error_rows_with_indices):
             messagebox.showinfo("Hoàn tất", "Đã duyệt qua tất cả các lỗi."); self.destroy(); return
@@ -94,7 +1439,7 @@ class ErrorEditorDialog(ctk.CTkToplevel):
         for widget in self.button_frame.winfo_children(): widget.pack_forget()
         if status == 'File not found':
             self.timecode_entry.configure(state="disabled"); self.filename_entry.configure(state="normal")
-            self.find_copy_button.pack(side="left", padx=5); self.create_gap_button.pack(side="left", padx=5)
+            self.find_copy_button.pack(side="left", padx=5); self.fetch_all_button.pack(side="left", padx=5); self.create_gap_button.pack(side="left", padx=5); self.accept_all_button.pack(side="left", padx=5)
         else:
             self.timecode_entry.configure(state="normal"); self.filename_entry.configure(state="normal")
             self.save_button.pack(side="left", padx=10); self.skip_button.pack(side="left", padx=10)
@@ -102,6 +1447,7 @@ class ErrorEditorDialog(ctk.CTkToplevel):
         self.filename_entry.delete(0, "end"); self.filename_entry.insert(0, row.get('filename', ''))
         self.timecode_entry.delete(0, "end"); self.timecode_entry.insert(0, row.get('Time in - time out', ''))
         self.status_label.configure(text="Chọn một hành động hoặc sửa thông tin rồi Lưu"); self.progress_label.configure(text=""); self.progress_bar.pack_forget()
+        self._request_thumbnail(row); self._show_suggestions()
     def find_and_copy_file(self, event=None):
         original_index, row = self.error_rows_with_indices[self.current_error_index]
         missing_filename = row.get('filename')
@@ -112,48 +1458,120 @@ class ErrorEditorDialog(ctk.CTkToplevel):
         if not dest_folder or not Path(dest_folder).is_dir(): messagebox.showerror("Lỗi", "Thư mục video nguồn không hợp lệ!"); return
         self.progress_bar.pack(pady=(0, 10), padx=20)
         for widget in self.button_frame.winfo_children(): widget.configure(state="disabled")
+        self.copy_progress = ProgressReporter(total=Path(src_path).stat().st_size, unit='MB', scale=1024 * 1024, decimals=1)
         copy_thread = threading.Thread(target=self.threaded_copy_with_progress, args=(src_path, dest_folder, original_index)); copy_thread.start()
+        sample_progress(self, self.copy_progress, self.progress_bar, self.progress_label, "Đang chép:")
     def threaded_copy_with_progress(self, src, dest_folder, original_index):
-        dest = Path(dest_folder) / Path(src).name
-        total_size = Path(src).stat().st_size
-        copied_size = 0
         try:
-            with open(src, 'rb') as fsrc, open(dest, 'wb') as fdest:
-                while True:
-                    chunk = fsrc.read(4096 * 1024)
-                    if not chunk: break
-                    fdest.write(chunk); copied_size += len(chunk)
-                    self.after(0, self.update_progress, copied_size / total_size, copied_size, total_size)
+            copy_file_fast(src, Path(dest_folder) / Path(src).name, self.copy_progress)
             self.after(0, self.finish_copy, original_index, True)
         except Exception as e: self.after(0, self.finish_copy, e, False)
-    def update_progress(self, progress, copied_size, total_size):
-        self.progress_bar.set(progress); self.progress_label.configure(text=f"Đang chép: {copied_size / (1024*1024):.1f} / {total_size / (1024*1024):.1f} MB")
+        finally: self.copy_progress.finish()
     def finish_copy(self, result_or_index, success):
         self.progress_bar.pack_forget()
         for widget in self.button_frame.winfo_children(): widget.configure(state="normal")
         if success:
             original_index = result_or_index
             row = self.parent.processed_data[original_index]
-            updated_row, _ = self.parent._validate_row(row)
-            self.parent.processed_data[original_index] = updated_row
+            self.parent._refresh_media_index(); updated_row, _ = self.parent._validate_row(row)
+            self.parent.processed_data[original_index] = updated_row; self.parent._refresh_preview_row(original_index)
             self.parent.log_message(f"Đã chép và xác thực lại file cho dòng {original_index + 1}", 'success'); self.next_error()
         else: messagebox.showerror("Lỗi sao chép", f"Không thể sao chép file: {result_or_index}")
+    def fetch_all_missing(self, event=None):
+        dest_folder = self.parent.full_video_path
+        if not dest_folder or not Path(dest_folder).is_dir(): messagebox.showerror("Lỗi", "Thư mục video nguồn không hợp lệ!"); return
+        search_root = filedialog.askdirectory(title="Chọn thư mục chứa các file bị thiếu")
+        if not search_root: return
+        missing = [original_index for original_index, _ in self.error_rows_with_indices[self.current_error_index:] if self.parent.processed_data[original_index].get('status') == 'File not found']
+        self.progress_bar.pack(pady=(0, 10), padx=20); self.progress_label.configure(text="Đang tìm file trong thư mục đã chọn...")
+        for widget in self.button_frame.winfo_children(): widget.configure(state="disabled")
+        self.copy_progress = ProgressReporter(unit='MB', scale=1024 * 1024, decimals=1)
+        fetch_thread = threading.Thread(target=self.threaded_fetch_all, args=(search_root, dest_folder, missing)); fetch_thread.start()
+        sample_progress(self, self.copy_progress, self.progress_bar, self.progress_label, "Đang chép:")
+    def threaded_fetch_all(self, search_root, dest_folder, missing):
+        fetched_count = 0; failed = []
+        try:
+            search_index = MediaIndex(search_root, recursive=True); search_index.refresh(); jobs = {}
+            for original_index in missing:
+                src = search_index.find(self.parent.processed_data[original_index].get('filename'))
+                if src: jobs.setdefault(src, []).append(original_index)
+            not_found_count = len(missing) - sum(len(indices) for indices in jobs.values())
+            self.copy_progress.total = sum(os.path.getsize(src) for src in jobs)
+            def fetch(src):
+                dest = str(copy_file_fast(src, Path(dest_folder) / Path(src).name, self.copy_progress))
+                for original_index in jobs[src]:
+                    updated_row, _ = validate_row(self.parent.processed_data[original_index].copy(), lambda _filename: dest, self.parent._probe_metadata, self.parent.metadata_cache, self.parent._probe_variant())
+                    self.after(0, self.apply_revalidated_row, original_index, updated_row)
+            with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool:
+                futures = {pool.submit(fetch, src): src for src in jobs}
+                for future in as_completed(futures):
+                    try: future.result(); fetched_count += 1
+                    except OSError as e: failed.append(f"{Path(futures[future]).name}: {e}")
+            self.after(0, self.finish_fetch_all, fetched_count, not_found_count, failed)
+        except Exception as e: self.after(0, self.finish_fetch_all, fetched_count, len(missing), [str(e)])
+        finally: self.copy_progress.finish()
+    def accept_high_confidence_matches(self, event=None):
+        if self.fuzzy_index is None: self.status_label.configure(text="Chỉ mục gợi ý chưa sẵn sàng, thử lại sau giây lát.", text_color="gray"); return
+        matches = []
+        for original_index, _ in self.error_rows_with_indices[self.current_error_index:]:
+            row = self.parent.processed_data[original_index]
+            if row.get('status') != 'File not found': continue
+            best_match = self.fuzzy_index.best_match(row.get('filename', ''))
+            if best_match: matches.append((original_index, best_match))
+        if not matches: self.status_label.configure(text=f"Không có gợi ý nào đủ chắc chắn (≥ {FUZZY_HIGH_CONFIDENCE:.0%}).", text_color="#F44336"); return
+        for widget in self.button_frame.winfo_children(): widget.configure(state="disabled")
+        self.progress_bar.pack(pady=(0, 10), padx=20); self.copy_progress = ProgressReporter(total=len(matches), unit='dòng')
+        threading.Thread(target=self.threaded_accept_matches, args=(matches,)).start()
+        sample_progress(self, self.copy_progress, self.progress_bar, self.progress_label, "Đang kiểm tra lại:")
+    def threaded_accept_matches(self, matches):
+        probe_once = self.parent._make_shared_probe(); failed = []
+        def revalidate(match):
+            original_index, new_name = match; row = self.parent.processed_data[original_index].copy(); old_name = row.filename; row.filename = new_name
+            updated_row, _ = self.parent._validate_row(row, probe_once); self.copy_progress.advance(1, new_name)
+            self.after(0, self.apply_revalidated_row, original_index, updated_row); self.parent.log_message(f"Dòng {original_index + 1}: '{old_name}' -> '{new_name}'")
+        try:
+            with ThreadPoolExecutor(max_workers=self.parent.scan_workers) as pool:
+                for future in as_completed([pool.submit(revalidate, match) for match in matches]):
+                    try: future.result()
+                    except Exception as e: failed.append(str(e))
+        finally: self.copy_progress.finish()
+        self.after(0, self.finish_accept_matches, len(matches) - len(failed), failed)
+    def finish_accept_matches(self, accepted_count, failed):
+        self.progress_bar.pack_forget()
+        for widget in self.button_frame.winfo_children(): widget.configure(state="normal")
+        for message in failed: self.parent.log_message(f"Không thể kiểm tra lại: {message}", 'error')
+        self.parent.metadata_cache.flush(); self._prune_resolved_errors()
+        messagebox.showinfo("Nhận gợi ý", f"Đã đổi tên file cho {accepted_count} dòng theo gợi ý chắc chắn.")
+        self.load_current_error()
+    def _prune_resolved_errors(self):
+        processed_data = self.parent.processed_data
+        self.error_rows_with_indices = self.error_rows_with_indices[:self.current_error_index] + [(i, processed_data[i]) for i, _ in self.error_rows_with_indices[self.current_error_index:] if is_error_row(processed_data[i])]
+    def apply_revalidated_row(self, original_index, updated_row):
+        self.parent.processed_data[original_index] = updated_row; self.parent._refresh_preview_row(original_index)
+        self.parent.log_message(f"Đã kiểm tra lại dòng {original_index + 1}: {updated_row.get('status')}", 'success' if updated_row.get('status') == 'ok' else 'error')
+    def finish_fetch_all(self, fetched_count, not_found_count, failed):
+        self.progress_bar.pack_forget()
+        for widget in self.button_frame.winfo_children(): widget.configure(state="normal")
+        self.parent._refresh_media_index(); self.parent.metadata_cache.flush()
+        for message in failed: self.parent.log_message(f"Không thể sao chép file: {message}", 'error')
+        self._prune_resolved_errors()
+        messagebox.showinfo("Chép hàng loạt", f"Đã chép {fetched_count} file.\nKhông tìm thấy: {not_found_count} file.\nLỗi sao chép: {len(failed)} file.")
+        self.load_current_error()
     def create_gap(self, event=None):
         original_index, row = self.error_rows_with_indices[self.current_error_index]
         try:
             timeline_fps_val = self.parent.fps_map[self.parent.fps_var.get()]
             fps = self.parent.most_common_fps if timeline_fps_val == 'auto' else timeline_fps_val
-            in_f, out_f = parse_inout(row.get('Time in - time out', ''), fps)
+            in_f, out_f = parse_inout(row.timecode, fps)
             if (out_f - in_f) <= 0: raise ValueError("Duration is not positive")
-            row['type'] = 'gap'; row['status'] = 'gap'
-            self.parent.processed_data[original_index] = row
+            self.parent.processed_data[original_index] = mark_as_gap(row); self.parent._refresh_preview_row(original_index)
             self.parent.log_message(f"Đã tạo khoảng trống cho dòng {original_index + 1}", 'success'); self.next_error()
         except Exception as e: self.status_label.configure(text=f"Không thể tạo khoảng trống. Lỗi timecode? ({e})", text_color="red")
     def save_and_recheck(self, event=None):
         original_index, row = self.error_rows_with_indices[self.current_error_index]
-        row['filename'] = self.filename_entry.get().strip(); row['Time in - time out'] = self.timecode_entry.get().strip()
-        updated_row, _ = self.parent._validate_row(row)
-        self.parent.processed_data[original_index] = updated_row
+        row.filename = self.filename_entry.get().strip(); row.timecode = self.timecode_entry.get().strip()
+        self.parent._refresh_media_index(); updated_row, _ = self.parent._validate_row(row)
+        self.parent.processed_data[original_index] = updated_row; self.parent._refresh_preview_row(original_index)
         new_status = updated_row.get('status')
         if new_status == 'ok':
             self.status_label.configure(text=f"Thành công! Trạng thái mới: OK", text_color="#00AA00"); self.after(1200, self.next_error)
@@ -167,25 +1585,49 @@ class ErrorEditorDialog(ctk.CTkToplevel):
             self.parent.log_message(f"Chuyển {remaining_count} lỗi còn lại thành khoảng trống...")
             for i in range(self.current_error_index, len(self.error_rows_with_indices)):
                 original_index, row = self.error_rows_with_indices[i]
-                row['type'] = 'gap'; row['status'] = 'gap'
-                self.parent.processed_data[original_index] = row
-            self.parent.log_message("Đã xử lý xong các lỗi còn lại.", 'success')
+                self.parent.processed_data[original_index] = mark_as_gap(row)
+            self.parent._update_csv_preview(self.parent.processed_data); self.parent.log_message("Đã xử lý xong các lỗi còn lại.", 'success')
         self.destroy()
 
 # --- Main Application Class (Wizard UI) ---
-class AutoCutApp(ctk.CTk):
+class AutoCutApp(ctk.CTk if ctk else object):
     def __init__(self):
         super().__init__()
         config_dir = Path.home() / ".autocut_gui_config"
         config_dir.mkdir(exist_ok=True)
         self.CONFIG_FILE = config_dir / "config.json"
-        self.full_csv_path = ""; self.full_video_path = ""; self.full_xml_path = ""
-        self.processed_data = []; self.most_common_fps = 25.0
+        self._metadata_cache = None; self._scan_state = None; self._thumbnail_cache = None; self._store_lock = threading.Lock(); self.startup_times = {}
+        self.show_thumbnails = True; self.thumbnail_cache_mb = 256; self._thumbnail_images = {}; self._hovered_row = None; self._prefetch_job = None
+        self.full_csv_path = ""; self.full_video_path = ""; self.full_xml_path = ""; self.script_rows = None
+        self.processed_data = []; self.most_common_fps = 25.0; self.scan_workers = os.cpu_count() or 4; self.probe_mode = 'light'; self.native_probe = True
         self.resolution_map = {"1080p (Full HD)": ("1920", "1080"), "2K / QHD": ("2560", "1440"), "4K UHD": ("3840", "2160"), "Tùy chỉnh...": "custom"}
         self.fps_map = {"24 fps": 24.0, "25 fps": 25.0, "29.97 fps (DF)": 29.97, "30 fps": 30.0, "59.94 fps (DF)": 59.94, "60 fps": 60.0, "Tự động theo media": "auto"}
+        self.media_index = None; self.recursive_media = False; self.trace_enabled = True; self.profile_runs = False; self.export_formats = ['xmeml']
+        self.watcher = None; self._watch_rows = []; self._watch_timeline = None; self._watch_settings = None
         self.CANONICAL_HEADERS = ['filename', 'Time in - time out', 'type', 'codec', 'framerate', 'color_profile', 'duration_frames', 'status']
         self._setup_ui(); self._create_widgets()
 
+    @property
+    def metadata_cache(self):
+        if self._metadata_cache is None:
+            with self._store_lock:
+                if self._metadata_cache is None: self._metadata_cache = MetadataCache(self.CONFIG_FILE.parent / "metadata_cache.sqlite")
+        return self._metadata_cache
+
+    @property
+    def thumbnail_cache(self):
+        if self._thumbnail_cache is None:
+            with self._store_lock:
+                if self._thumbnail_cache is None: self._thumbnail_cache = ThumbnailCache(self.CONFIG_FILE.parent / "thumbnails", max_bytes=self.thumbnail_cache_mb * 1024 * 1024)
+        return self._thumbnail_cache
+
+    @property
+    def scan_state(self):
+        if self._scan_state is None:
+            with self._store_lock:
+                if self._scan_state is None: self._scan_state = ScanStateStore(self.CONFIG_FILE.parent / "scan_state.sqlite")
+        return self._scan_state
+
     def _setup_ui(self):
         self.title("SnipSnip (v25.09.19) by NamNhọ@visualStation")
         self.geometry("1000x750")
@@ -193,29 +1635,54 @@ class AutoCutApp(ctk.CTk):
         self.grid_rowconfigure(1, weight=1)
         ctk.set_appearance_mode("dark")
         self.log_colors = ['#00AA00', '#00AAAA', '#AA00AA', '#FFAA00', '#5555FF', '#55FF55', '#55FFFF', '#FF5555', '#FF55FF', '#FFFFFF']
-        self.log_color_index = 0
+        self.log_color_index = 0; self.log_queue = queue.SimpleQueue(); self.file_logger = None; self.log_to_file = False
+        self.LOG_FLUSH_INTERVAL_MS = 50; self.LOG_MAX_BATCH = 500; self.LOG_MAX_LINES = 5000
 
     def _create_widgets(self):
         self.status_label = ctk.CTkLabel(self, text="", font=ctk.CTkFont(size=16), anchor="center"); self.status_label.grid(row=0, column=0, padx=20, pady=(10,10))
-        container = ctk.CTkFrame(self, fg_color="transparent"); container.grid(row=1, column=0, sticky='nsew', padx=20, pady=10); container.grid_columnconfigure(0, weight=1); container.grid_rowconfigure(0, weight=1)
-        self.screen1_script = self._create_screen1_script(container)
-        self.screen2_video = self._create_screen2_video(container)
-        self.screen3_main = self._create_screen3_main(container)
-        for frame in [self.screen1_script, self.screen2_video, self.screen3_main]: frame.grid(row=0, column=0, sticky='nsew')
-        self.load_config()
-        self._show_screen(1)
+        self.screen_container = ctk.CTkFrame(self, fg_color="transparent"); self.screen_container.grid(row=1, column=0, sticky='nsew', padx=20, pady=10); self.screen_container.grid_columnconfigure(0, weight=1); self.screen_container.grid_rowconfigure(0, weight=1)
+        self.startup_label = ctk.CTkLabel(self, text="", font=ctk.CTkFont(size=11), text_color="gray"); self.startup_label.grid(row=2, column=0, padx=20, pady=(0,5))
+        self.screens = {}; self.load_config(); self._setup_file_logging()
+        self._show_screen(1); self._flush_log_queue(); self.after_idle(self._record_startup_time)
+
+    def _ensure_screen(self, screen_number):
+        frame = self.screens.get(screen_number)
+        if frame is None:
+            builder = {1: self._create_screen1_script, 2: self._create_screen2_video, 3: self._create_screen3_main}[screen_number]
+            frame = self.screens[screen_number] = builder(self.screen_container); frame.grid(row=0, column=0, sticky='nsew')
+            if screen_number == 3: self._sync_screen3()
+        return frame
+
+    def _sync_screen3(self):
+        self.recursive_var.set(self.recursive_media); self.profile_var.set(self.profile_runs); self.thumbnail_var.set(self.show_thumbnails)
+        if not self.show_thumbnails: self.preview_thumbnail_frame.grid_remove()
+        for export_format, var in self.export_format_vars.items(): var.set(export_format in self.export_formats)
+        self._set_path_entries()
+
+    def _set_path_entries(self):
+        if 3 not in self.screens: return
+        for entry, path in ((self.csv_entry, self.full_csv_path), (self.video_entry, self.full_video_path), (self.xml_entry, self.full_xml_path)):
+            entry.delete(0, "end")
+            if path: entry.insert(0, Path(path).name)
+
+    def _record_startup_time(self):
+        self.startup_times = {'imports': IMPORTS_FINISHED - STARTUP_STARTED, 'first_frame': time.perf_counter() - STARTUP_STARTED}
+        message = self.format_startup_time(); self.startup_label.configure(text=message); self.log_message(message)
+
+    def format_startup_time(self):
+        return f"Khởi động: import {self.startup_times['imports'] * 1000:.0f}ms, hiện màn hình đầu tiên sau {self.startup_times['first_frame'] * 1000:.0f}ms"
 
     def _show_screen(self, screen_number):
-        if screen_number == 1: self.status_label.configure(text="Bước 1: Cho xin kịch bản đi bạn ơi\n ( giờ chỉ đang hỗ trợ file CSV \n xoá bớt mấy note linh tinh trong ggsheet \n tách sẵn filename + timecode thành cột  rồi bấm tải về csv \n hoặc link Google Sheet - hơi hên xui)", justify="center"); self.screen1_script.tkraise()
-        elif screen_number == 2: self.status_label.configure(text="Bước 2: Chọn thư mục chứa source video đã tải về", justify="center"); self.screen2_video.tkraise()
-        elif screen_number == 3: self.status_label.configure(text="Bước 3: Tạo Sequence với thông số ở dưới?", justify="center"); self.screen3_main.tkraise()
+        if screen_number == 1: self.status_label.configure(text="Bước 1: Cho xin kịch bản đi bạn ơi\n ( giờ chỉ đang hỗ trợ file CSV \n xoá bớt mấy note linh tinh trong ggsheet \n tách sẵn filename + timecode thành cột  rồi bấm tải về csv \n hoặc link Google Sheet - hơi hên xui)", justify="center"); self._ensure_screen(1).tkraise()
+        elif screen_number == 2: self.status_label.configure(text="Bước 2: Chọn thư mục chứa source video đã tải về", justify="center"); self.startup_label.grid_remove(); self._ensure_screen(2).tkraise()
+        elif screen_number == 3: self.status_label.configure(text="Bước 3: Tạo Sequence với thông số ở dưới?", justify="center"); self.startup_label.grid_remove(); self._ensure_screen(3).tkraise()
 
     def _create_screen1_script(self, parent):
         frame = ctk.CTkFrame(parent, fg_color="transparent"); frame.grid_columnconfigure(0, weight=1); frame.grid_rowconfigure(1, weight=1)
         ctk.CTkLabel(frame, text="Xin chào! Hãy bắt đầu nào.", font=ctk.CTkFont(size=28, weight="bold")).pack(pady=(20, 40))
         button_frame = ctk.CTkFrame(frame, fg_color="transparent"); button_frame.pack(pady=20)
         ctk.CTkButton(button_frame, text="📂 Chọn file Kịch bản trong PC ?", width=300, height=60, command=self.browse_csv, font=ctk.CTkFont(size=16)).pack(pady=15, padx=20)
-        ctk.CTkButton(button_frame, text="🔗 Kịch bản trong link Google Sheet", width=300, height=60, command=self.import_from_google_sheet, font=ctk.CTkFont(size=16)).pack(pady=15, padx=20)
+        self.gsheet_button = ctk.CTkButton(button_frame, text="🔗 Kịch bản trong link Google Sheet", width=300, height=60, command=self.import_from_google_sheet, font=ctk.CTkFont(size=16)); self.gsheet_button.pack(pady=15, padx=20)
         return frame
 
     def _create_screen2_video(self, parent):
@@ -251,26 +1718,132 @@ class AutoCutApp(ctk.CTk):
         ctk.CTkLabel(options_frame, text="Timeline FPS:").grid(row=1, column=0, padx=(10,5), pady=10, sticky="e"); 
         self.fps_var = ctk.StringVar(value="Tự động theo media"); 
         self.fps_menu = ctk.CTkOptionMenu(options_frame, variable=self.fps_var, values=list(self.fps_map.keys())); self.fps_menu.grid(row=1, column=1, padx=5, pady=10, sticky="w")
+        self.recursive_var = ctk.BooleanVar(value=False)
+        self.recursive_checkbox = ctk.CTkCheckBox(options_frame, text="Tìm cả trong thư mục con", variable=self.recursive_var, command=self._on_recursive_change); self.recursive_checkbox.grid(row=2, column=0, columnspan=3, padx=10, pady=(0,10), sticky="w")
+        self.profile_var = ctk.BooleanVar(value=False)
+        self.profile_checkbox = ctk.CTkCheckBox(options_frame, text="Ghi cProfile cho mỗi lần chạy", variable=self.profile_var, command=self._on_profile_change); self.profile_checkbox.grid(row=3, column=0, columnspan=3, padx=10, pady=(0,10), sticky="w")
+        ctk.CTkLabel(options_frame, text="Xuất thêm:").grid(row=4, column=0, padx=(10,5), pady=(0,10), sticky="e")
+        export_formats_frame = ctk.CTkFrame(options_frame, fg_color="transparent"); export_formats_frame.grid(row=4, column=1, columnspan=2, padx=5, pady=(0,10), sticky="w"); self.export_format_vars = {}
+        for export_format, label in (('fcpxml', "FCPXML"), ('edl', "EDL"), ('otio', "OTIO")):
+            self.export_format_vars[export_format] = ctk.BooleanVar(value=False)
+            ctk.CTkCheckBox(export_formats_frame, text=label, width=80, variable=self.export_format_vars[export_format], command=self._on_export_formats_change).pack(side="left", padx=(0,10))
         action_frame = ctk.CTkFrame(left_frame, corner_radius=12); action_frame.grid(row=2, column=0, sticky='ew'); action_frame.grid_columnconfigure((0, 1), weight=1)
         self.scan_button = ctk.CTkButton(action_frame, text="🔍 Scan & Kiểm tra", height=40, command=self.scan_data, corner_radius=8); self.scan_button.grid(row=0, column=0, pady=10, padx=(10,5), sticky="ew")
         self.generate_button = ctk.CTkButton(action_frame, text="🚀 Tạo XML", height=40, command=self.generate_xml, corner_radius=8, state="disabled"); self.generate_button.grid(row=0, column=1, pady=10, padx=(5,10), sticky="ew")
+        self.clear_cache_button = ctk.CTkButton(action_frame, text="🧹 Xoá cache metadata", height=28, command=self.clear_metadata_cache, corner_radius=8, fg_color="transparent", border_width=1); self.clear_cache_button.grid(row=1, column=0, pady=(0,10), padx=(10,5), sticky="ew")
+        self.export_trace_button = ctk.CTkButton(action_frame, text="📈 Xuất trace", height=28, command=self.export_trace, corner_radius=8, fg_color="transparent", border_width=1); self.export_trace_button.grid(row=1, column=1, pady=(0,10), padx=(5,10), sticky="ew")
+        self.watch_button = ctk.CTkButton(action_frame, text="👁 Theo dõi thay đổi", height=28, command=self.toggle_watch, corner_radius=8, fg_color="transparent", border_width=1); self.watch_button.grid(row=2, column=1, pady=(0,10), padx=(5,10), sticky="ew")
+        self.pipeline_button = ctk.CTkButton(action_frame, text="⚡ Quét & tạo XML liền", height=28, command=self.scan_and_generate, corner_radius=8, fg_color="transparent", border_width=1); self.pipeline_button.grid(row=2, column=0, pady=(0,10), padx=(10,5), sticky="ew")
         self.scan_progress_label = ctk.CTkLabel(left_frame, text="", anchor="w"); self.scan_progress_label.grid(row=3, column=0, sticky="ew", padx=10, pady=(5,0))
         self.scan_progress_bar = ctk.CTkProgressBar(left_frame, corner_radius=8); self.scan_progress_bar.grid(row=4, column=0, sticky="ew", padx=10, pady=(0,5))
         self.scan_progress_label.grid_remove(); self.scan_progress_bar.grid_remove()
         self.console_text = ctk.CTkTextbox(left_frame, height=200, corner_radius=8); self.console_text.grid(row=5, column=0, sticky="nsew", pady=12); self.console_text.configure(state="disabled")
-        ctk.CTkLabel(right_frame, text="CSV Data Preview").grid(row=0, column=0, pady=5)
-        self.csv_preview_text = ctk.CTkTextbox(right_frame, corner_radius=8, font=("Consolas", 11)); self.csv_preview_text.grid(row=1, column=0, sticky="nsew", padx=8, pady=(0,8)); self.csv_preview_text.configure(state="disabled")
+        for i, color in enumerate(self.log_colors): self.console_text.tag_config(f'color_{i}', foreground=color)
+        self.console_text.tag_config("warning_highlight", background="yellow", foreground="black", justify='center')
+        preview_header = ctk.CTkFrame(right_frame, fg_color="transparent"); preview_header.grid(row=0, column=0, columnspan=2, sticky="ew", padx=8); preview_header.grid_columnconfigure(0, weight=1)
+        ctk.CTkLabel(preview_header, text="CSV Data Preview").grid(row=0, column=0, pady=5, sticky="w")
+        self.preview_filter_var = ctk.StringVar(value="Tất cả")
+        self.preview_filter_menu = ctk.CTkOptionMenu(preview_header, variable=self.preview_filter_var, values=["Tất cả", "Chỉ lỗi"], width=180, command=lambda _: self._apply_preview_filter()); self.preview_filter_menu.grid(row=0, column=2, pady=5, sticky="e")
+        self.thumbnail_var = ctk.BooleanVar(value=True)
+        ctk.CTkCheckBox(preview_header, text="Thumbnail", width=90, variable=self.thumbnail_var, command=self._on_thumbnail_change).grid(row=0, column=1, padx=(0,8), pady=5, sticky="e")
+        self.csv_preview_text = ctk.CTkTextbox(right_frame, corner_radius=8, font=("Consolas", 11), wrap="none", activate_scrollbars=False); self.csv_preview_text.grid(row=1, column=0, sticky="nsew", padx=(8,0), pady=(0,8)); self.csv_preview_text.configure(state="disabled")
+        self.preview_scrollbar = ctk.CTkScrollbar(right_frame, command=self._on_preview_scroll); self.preview_scrollbar.grid(row=1, column=1, sticky="ns", padx=(0,4), pady=(0,8))
+        self.preview_thumbnail_frame = ctk.CTkFrame(right_frame, fg_color="transparent"); self.preview_thumbnail_frame.grid(row=2, column=0, columnspan=2, sticky="ew", padx=8, pady=(0,8))
+        self._blank_thumbnail = tk.PhotoImage(width=THUMBNAIL_SIZE[0], height=THUMBNAIL_SIZE[1])
+        self.preview_thumbnail_label = tk.Label(self.preview_thumbnail_frame, image=self._blank_thumbnail, borderwidth=0, highlightthickness=0); self.preview_thumbnail_label.pack(side="left")
+        self.preview_thumbnail_caption = ctk.CTkLabel(self.preview_thumbnail_frame, text="Rê chuột lên một dòng để xem khung hình điểm vào", justify="left", anchor="w"); self.preview_thumbnail_caption.pack(side="left", padx=10, fill="x")
+        self.csv_preview_text.bind("<Motion>", self._on_preview_hover)
+        self.csv_preview_text.bind("<Configure>", lambda e: self._render_preview_page()); self.csv_preview_text.bind("<MouseWheel>", self._on_preview_wheel)
+        self.csv_preview_text.bind("<Button-4>", lambda e: self._scroll_preview(-3)); self.csv_preview_text.bind("<Button-5>", lambda e: self._scroll_preview(3))
+        self.preview_rows = []; self.preview_positions = {}; self.preview_offset = 0; self._preview_source = []; self._setup_preview_tags()
         return frame
 
     def _on_resolution_change(self, choice):
         if choice == "Tùy chỉnh...": self.custom_res_frame.grid()
         else: self.custom_res_frame.grid_remove()
 
+    def _on_recursive_change(self):
+        self.recursive_media = bool(self.recursive_var.get()); self.save_config()
+
+    def _on_export_formats_change(self):
+        self.export_formats = ['xmeml'] + [export_format for export_format, var in self.export_format_vars.items() if var.get()]; self.save_config()
+
+    def _on_thumbnail_change(self):
+        self.show_thumbnails = bool(self.thumbnail_var.get()); self.save_config(); self._hovered_row = None
+        if self.show_thumbnails: self.preview_thumbnail_frame.grid(); self._render_preview_page()
+        else: self.preview_thumbnail_frame.grid_remove()
+
+    def _on_profile_change(self):
+        self.profile_runs = bool(self.profile_var.get()); self.save_config()
+
+    def _start_trace(self):
+        TRACER.enabled = self.trace_enabled; TRACER.reset()
+        if self.profile_runs: TRACER.start_profile()
+
+    def _report_trace(self, stage_name):
+        if TRACER.events: self.log_message(f"Thời gian từng giai đoạn ({stage_name}):\n{TRACER.format_summary()}")
+        if not TRACER.profiling: return
+        profile_dir = self.CONFIG_FILE.parent / "profiles"; profile_dir.mkdir(exist_ok=True)
+        profile_path = profile_dir / f"{stage_name}_{time.strftime('%Y%m%d_%H%M%S')}.prof"
+        try: report = TRACER.stop_profile(profile_path)
+        except OSError as e: self.log_message(f"Không thể lưu cProfile: {e}", 'error'); return
+        if report: self.log_message(f"Đã lưu cProfile: {profile_path}\n{report}")
+
+    def export_trace(self):
+        if not TRACER.events: messagebox.showinfo("Trace", "Chưa có dữ liệu trace. Hãy Scan hoặc tạo XML trước nhé!"); return
+        path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("Chrome trace", "*.json")], initialfile="snipsnip_trace.json")
+        if not path: return
+        try: event_count = TRACER.export_chrome_trace(path); self.log_message(f"Đã xuất {event_count} sự kiện trace: {Path(path).name} (mở bằng chrome://tracing hoặc ui.perfetto.dev)", 'success')
+        except OSError as e: self.log_message(f"Không thể xuất trace: {e}", 'error')
+
+    def _get_media_index(self):
+        root = os.path.abspath(self.full_video_path)
+        if self.media_index is None or self.media_index.root != root or self.media_index.recursive != self.recursive_media:
+            store_name = hashlib.sha1(f"{root}|{self.recursive_media}".encode('utf-8')).hexdigest()[:16]
+            store_dir = self.CONFIG_FILE.parent / "media_index"; store_dir.mkdir(exist_ok=True)
+            self.media_index = MediaIndex(root, recursive=self.recursive_media, store_path=store_dir / f"{store_name}.json")
+        return self.media_index
+
+    def _refresh_media_index(self):
+        media_index = self._get_media_index(); media_index.refresh()
+        try: media_index.save()
+        except OSError as e: self.log_message(f"Không thể lưu chỉ mục media: {e}", 'error')
+        return media_index
+
     def log_message(self, message, status_type=None):
-        self.console_text.configure(state="normal"); color = self.log_colors[self.log_color_index]; tag_name = f'color_{self.log_color_index}'; self.console_text.tag_config(tag_name, foreground=color); self.console_text.insert("end", message + '\n', tag_name); self.console_text.see("end"); self.console_text.configure(state="disabled"); self.log_color_index = (self.log_color_index + 1) % len(self.log_colors); self.update_idletasks()
+        self.log_queue.put((message + '\n', None))
+        if self.file_logger is not None: self.file_logger.log(logging.ERROR if status_type == 'error' else logging.INFO, message)
+
+    def _setup_file_logging(self):
+        if not self.log_to_file or self.file_logger is not None: return
+        import logging.handlers
+        file_handler = logging.handlers.RotatingFileHandler(self.CONFIG_FILE.parent / "snipsnip.log", maxBytes=2 * 1024 * 1024, backupCount=3, encoding='utf-8'); file_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+        log_records = queue.SimpleQueue(); self._log_listener = logging.handlers.QueueListener(log_records, file_handler); self._log_listener.start()
+        self.file_logger = logging.getLogger("snipsnip"); self.file_logger.setLevel(logging.INFO); self.file_logger.propagate = False; self.file_logger.addHandler(logging.handlers.QueueHandler(log_records))
+
+    def _flush_log_queue(self):
+        self._drain_log_queue(); self.after(self.LOG_FLUSH_INTERVAL_MS, self._flush_log_queue)
+
+    def _drain_log_queue(self):
+        if 3 not in self.screens: return
+        pending = []
+        try:
+            while len(pending) < self.LOG_MAX_BATCH: pending.append(self.log_queue.get_nowait())
+        except queue.Empty: pass
+        if pending:
+            self.console_text.configure(state="normal")
+            for text, tag_name in pending:
+                if tag_name is None: tag_name = f'color_{self.log_color_index}'; self.log_color_index = (self.log_color_index + 1) % len(self.log_colors)
+                self.console_text.insert("end", text, tag_name)
+            overflow = int(self.console_text.index("end-1c").split('.')[0]) - self.LOG_MAX_LINES
+            if overflow > 0: self.console_text.delete("1.0", f"{overflow + 1}.0")
+            self.console_text.see("end"); self.console_text.configure(state="disabled")
+
+    def clear_metadata_cache(self):
+        removed = self.metadata_cache.invalidate(); self.scan_state.forget(); self.log_message(f"Đã xoá {removed} mục trong cache metadata.", 'success')
 
     def save_config(self):
-        config_data = {'csv_path': str(self.full_csv_path), 'video_path': str(self.full_video_path), 'xml_path': str(self.full_xml_path)}
+        config_data = {'csv_path': str(self.full_csv_path), 'video_path': str(self.full_video_path), 'xml_path': str(self.full_xml_path), 'scan_workers': self.scan_workers, 'probe_mode': self.probe_mode, 'native_probe': self.native_probe, 'recursive_media': self.recursive_media, 'log_to_file': self.log_to_file, 'trace_enabled': self.trace_enabled, 'profile_runs': self.profile_runs, 'export_formats': self.export_formats, 'show_thumbnails': self.show_thumbnails, 'thumbnail_cache_mb': self.thumbnail_cache_mb}
         with open(self.CONFIG_FILE, 'w') as f: json.dump(config_data, f, indent=4)
 
     def load_config(self):
@@ -278,19 +1851,25 @@ class AutoCutApp(ctk.CTk):
             if self.CONFIG_FILE.exists():
                 with open(self.CONFIG_FILE, 'r') as f: config_data = json.load(f)
                 self.full_csv_path = config_data.get('csv_path', '')
+                if self.full_csv_path and not Path(self.full_csv_path).exists(): self.full_csv_path = ''
                 self.full_video_path = config_data.get('video_path', '')
                 self.full_xml_path = config_data.get('xml_path', '')
-                if self.full_csv_path: self.csv_entry.insert(0, Path(self.full_csv_path).name)
-                if self.full_video_path: self.video_entry.insert(0, Path(self.full_video_path).name)
-                if self.full_xml_path: self.xml_entry.insert(0, Path(self.full_xml_path).name)
-        except (json.JSONDecodeError, KeyError) as e:
+                self.scan_workers = max(1, int(config_data.get('scan_workers') or self.scan_workers))
+                self.probe_mode = 'full' if config_data.get('probe_mode') == 'full' else 'light'; self.native_probe = bool(config_data.get('native_probe', True))
+                self.recursive_media = bool(config_data.get('recursive_media', False))
+                self.log_to_file = bool(config_data.get('log_to_file', False))
+                self.export_formats = ['xmeml'] + [export_format for export_format in config_data.get('export_formats', []) if export_format in EXPORTERS and export_format != 'xmeml']
+                self.trace_enabled = bool(config_data.get('trace_enabled', True)); self.profile_runs = bool(config_data.get('profile_runs', False))
+                self.show_thumbnails = bool(config_data.get('show_thumbnails', True)); self.thumbnail_cache_mb = max(1, int(config_data.get('thumbnail_cache_mb') or self.thumbnail_cache_mb))
+                if 3 in self.screens: self._sync_screen3()
+        except (json.JSONDecodeError, KeyError, ValueError, TypeError) as e:
             self.log_message(f"Lỗi đọc file config: {e}", 'error')
 
     def browse_csv(self):
         path = filedialog.askopenfilename(filetypes=[("CSV files", "*.csv")]);
         if path:
-            self.full_csv_path = path
-            self.csv_entry.delete(0, "end"); self.csv_entry.insert(0, Path(path).name)
+            self.full_csv_path = path; self.script_rows = None
+            self._set_path_entries()
             self.log_message(f"Đã chọn kịch bản: {Path(path).name}")
             self.save_config(); self._show_screen(2)
 
@@ -298,101 +1877,59 @@ class AutoCutApp(ctk.CTk):
         path = filedialog.askdirectory();
         if path:
             self.full_video_path = path
-            self.video_entry.delete(0, "end"); self.video_entry.insert(0, Path(path).name)
+            self._set_path_entries()
             self.log_message(f"Đã chọn thư mục video: {Path(path).name}")
             self.save_config(); self._show_screen(3)
 
     def browse_xml_output(self):
         initial_file = Path(self.full_csv_path).stem + "_Final.xml" if self.full_csv_path else "output.xml"
         path = filedialog.asksaveasfilename(defaultextension=".xml", filetypes=[("XML files", "*.xml")], initialfile=initial_file)
-        if path: self.full_xml_path = path; self.xml_entry.delete(0, "end"); self.xml_entry.insert(0, Path(path).name); self.log_message(f"File XML sẽ được lưu tại: {Path(path).name}"); self.save_config()
+        if path: self.full_xml_path = path; self._set_path_entries(); self.log_message(f"File XML sẽ được lưu tại: {Path(path).name}"); self.save_config()
 
     def import_from_google_sheet(self):
-        dialog = ctk.CTkInputDialog(text="Dán link Google Sheet vào đây:", title="Nhập từ Google Sheet"); url = dialog.get_input()
+        dialog = ctk.CTkInputDialog(text="Dán một hoặc nhiều link Google Sheet (mỗi tab một link) vào đây:", title="Nhập từ Google Sheet"); url = dialog.get_input()
         if not url: return
+        try: sheets = parse_google_sheet_links(url)
+        except ValueError as e: self.log_message(f"Lỗi khi nhập từ Google Sheet: {e}", 'error'); messagebox.showerror("Lỗi", f"Không thể nhập dữ liệu từ Google Sheet:\n{e}"); return
+        self.gsheet_button.configure(state='disabled'); self.log_message(f"Đang tải {len(sheets)} tab từ Google Sheet...")
+        import_thread = threading.Thread(target=self.threaded_import_google_sheet, args=(sheets,)); import_thread.start()
+
+    def threaded_import_google_sheet(self, sheets):
+        try:
+            fetcher = SheetFetcher(self.CONFIG_FILE.parent / "sheet_cache")
+            responses = fetcher.fetch_many(sheets); script_rows = []; skipped_rows_info = []
+            for (sheet_id, gid), (raw_data, from_cache) in zip(sheets, responses):
+                self.log_message(f"Tab gid={gid}: " + ("không đổi, dùng bản đã lưu" if from_cache else f"đã tải {len(raw_data) / 1024:.1f} KB"))
+                sheet_skipped = []; script_rows.extend(iter_google_sheet_rows(raw_data, sheet_skipped))
+                skipped_rows_info.extend(dict(info, gid=gid) for info in sheet_skipped)
+            if not script_rows: raise Exception("Không tìm thấy dữ liệu hợp lệ sau khi dọn dẹp.")
+            self.after(0, self.finish_google_sheet_import, True, (script_rows, skipped_rows_info))
+        except Exception as e: self.after(0, self.finish_google_sheet_import, False, e)
+
+    def finish_google_sheet_import(self, success, result):
+        self.gsheet_button.configure(state='normal')
+        if not success: self.log_message(f"Lỗi khi nhập từ Google Sheet: {result}", 'error'); messagebox.showerror("Lỗi", f"Không thể nhập dữ liệu từ Google Sheet:\n{result}"); return
+        script_rows, skipped_rows_info = result; temp_csv_path = self.CONFIG_FILE.parent / "g_sheet_import.csv"
         try:
-            match = re.search(r'/spreadsheets/d/([a-zA-Z0-9-_]+)(/.*)?gid=([0-9]+)', url)
-            if not match: raise ValueError("Link Google Sheet không hợp lệ hoặc không chứa GID.")
-            sheet_id, gid = match.group(1), match.group(3)
-            download_url = f'https://docs.google.com/spreadsheets/d/{sheet_id}/export?format=csv&gid={gid}'
-            self.log_message("Đang tải dữ liệu từ Google Sheet..."); self.update_idletasks()
-            with urllib.request.urlopen(download_url) as response:
-                if response.getcode() != 200: raise Exception(f"Lỗi máy chủ: {response.getcode()}")
-                raw_data = response.read()
-            self.log_message("Đang dọn dẹp dữ liệu..."); self.update_idletasks()
-            cleaned_csv_content, skipped_rows_info = self.clean_google_sheet_data(raw_data)
-            if not cleaned_csv_content: raise Exception("Không tìm thấy dữ liệu hợp lệ sau khi dọn dẹp.")
-            temp_dir = self.CONFIG_FILE.parent; temp_csv_path = temp_dir / "g_sheet_import.csv"
-            temp_csv_path.write_text(cleaned_csv_content, encoding='utf-8')
             if skipped_rows_info:
                 reason_counts = Counter(info['reason'] for info in skipped_rows_info)
                 summary_messages = [f"- {count} dòng: {reason}" for reason, count in reason_counts.items()]
                 summary_text = "\n".join(summary_messages)
                 self.log_message(f"Đã bỏ qua {len(skipped_rows_info)} dòng không hợp lệ. Chi tiết:", 'error'); self.log_message(summary_text, 'error')
                 messagebox.showinfo("Dọn dẹp dữ liệu", f"Đã bỏ qua {len(skipped_rows_info)} dòng không hợp lệ.\n\nChi tiết:\n{summary_text}")
-            self.full_csv_path = str(temp_csv_path)
-            self.csv_entry.delete(0, "end"); self.csv_entry.insert(0, temp_csv_path.name)
-            self.log_message(f"Đã nhập thành công từ Google Sheet: {temp_csv_path.name}", 'success')
+            self.full_csv_path = str(temp_csv_path); self.script_rows = script_rows
+            self._set_path_entries()
+            self.log_message(f"Đã nhập thành công {len(script_rows)} dòng từ Google Sheet.", 'success')
             self.save_config(); self._show_screen(2)
         except Exception as e: self.log_message(f"Lỗi khi nhập từ Google Sheet: {e}", 'error'); messagebox.showerror("Lỗi", f"Không thể nhập dữ liệu từ Google Sheet:\n{e}")
 
-    def clean_google_sheet_data(self, raw_data):
-        cleaned_rows = []; skipped_rows_info = []
-        decoded_content = raw_data.decode('utf-8', errors='ignore')
-        csv_file = io.StringIO(decoded_content); reader = csv.reader(csv_file)
-        timecode_segment_pattern = r'(?:\d{1,2}:)?\d{1,2}:\d{2}\s*-\s*(?:\d{1,2}:)?\d{1,2}:\d{2}'
-        for i, row in enumerate(reader):
-            row_num = i + 1
-            if any('(BỎ)' in str(cell).upper() for cell in row): skipped_rows_info.append({'row_index': row_num, 'raw_row': ','.join(row), 'reason': 'Chứa từ khóa "(BỎ)"'}); continue
-            if len(row) < 5:
-                if len(row) > 0 and 'FRAME' in str(row[0]).upper() and len(row) > 2 and 'TIMECODE' in str(row[2]).upper() and len(row) > 4 and 'SOURCE' in str(row[4]).upper(): continue
-                skipped_rows_info.append({'row_index': row_num, 'raw_row': ','.join(row), 'reason': 'Dòng quá ngắn để chứa dữ liệu hợp lệ'}); continue
-            found_filename = None; found_timecode = None
-            for cell_content in row:
-                cell_content_stripped = str(cell_content).strip()
-                if not found_filename and any(cell_content_stripped.upper().endswith(ext) for ext in ['.MP4', '.MOV', '.MXF', '.MTS', '.AVI', '.WMV', '.FLV', '.WEBM']): found_filename = cell_content_stripped
-                temp_timecode_raw = cell_content_stripped.replace('\n', ' ')
-                match_colon_timecode = re.match(r'(\d{1,2}:\d{2}):(\d{1,2}:\d{2})', temp_timecode_raw)
-                if match_colon_timecode: temp_timecode_raw = f"{match_colon_timecode.group(1)}-{match_colon_timecode.group(2)}"
-                if not found_timecode and re.search(timecode_segment_pattern, temp_timecode_raw): found_timecode = temp_timecode_raw
-                if found_filename and found_timecode: break
-            if found_filename and found_timecode:
-                timecode_raw = found_timecode; filename_raw = found_filename
-                is_video = any(filename_raw.upper().endswith(ext) for ext in ['.MP4', '.MOV', '.MXF', '.MTS', '.AVI', '.WMV', '.FLV', '.WEBM'])
-                found_timecode_segments_in_raw = re.findall(timecode_segment_pattern, timecode_raw)
-                if is_video and found_timecode_segments_in_raw:
-                    timecode_cleaned_full = re.sub(r'\(.*?\)', '', timecode_raw).strip()
-                    segments = re.findall(timecode_segment_pattern, timecode_cleaned_full)
-                    if segments: [cleaned_rows.append([filename_raw, segment.strip()]) for segment in segments]
-                    else: skipped_rows_info.append({'row_index': row_num, 'raw_row': ','.join(row), 'reason': 'Timecode không hợp lệ sau khi làm sạch'})
-                else: skipped_rows_info.append({'row_index': row_num, 'raw_row': ','.join(row), 'reason': 'Không phải dòng dữ liệu hợp lệ (thiếu tên file/timecode)'}); continue
-        if not cleaned_rows: return "", skipped_rows_info
-        output = io.StringIO(); writer = csv.writer(output); writer.writerow(['filename', 'Time in - time out']); writer.writerows(cleaned_rows)
-        return output.getvalue(), skipped_rows_info
-
     def _read_csv_rows(self):
-        rows = []
-        with open(self.full_csv_path, 'r', newline='', encoding='utf-8-sig') as f:
-            try: has_header = csv.Sniffer().has_header(f.read(2048)) 
-            except csv.Error: has_header = False
-            f.seek(0); use_fallback = False
-            if has_header:
-                reader = csv.DictReader(f)
-                def normalize(s): return s.lower().strip().replace(" ", "").replace("-", "")
-                field_map = {normalize(field): field for field in reader.fieldnames}
-                filename_header = next((field_map[k] for k in field_map if any(keyword in k for keyword in ['file', 'tên', 'tệp'])), None)
-                timecode_header = next((field_map[k] for k in field_map if any(keyword in k for keyword in ['time', 'inout', 'thờigian'])), None)
-                if filename_header and timecode_header:
-                    self.log_message("Đã nhận diện cột filename và timecode từ header.")
-                    for row in reader:
-                        if not row.get(filename_header) or row.get(filename_header) == filename_header: continue
-                        rows.append({'filename': row[filename_header].replace('\n',' ').strip(), 'Time in - time out': row[timecode_header].replace('\n',' ').strip()})
-                else: self.log_message("Không nhận diện được cột từ header, chuyển sang chế độ dự phòng.", 'error'); use_fallback = True
-            if not has_header or use_fallback:
-                self.log_message("Đang đọc file theo thứ tự cột mặc định."); f.seek(0); reader = csv.reader(f)
-                for r in reader:
-                    if len(r) >= 2 and r[0] and r[0] != 'filename': rows.append({'filename': r[0].strip().replace('\n',' '), 'Time in - time out': r[1].strip().replace('\n',' ')})
-        return rows
+        if self.script_rows is not None: rows, self.script_rows = self.script_rows, None; return rows
+        return read_csv_rows(self.full_csv_path, self.log_message)
+
+    def _iter_script_rows(self):
+        if self.script_rows is not None: rows, self.script_rows = self.script_rows, None; return iter(rows)
+        return iter_csv_rows(self.full_csv_path, self.log_message)
 
     def _setup_preview_tags(self):
         status_colors = {"ok": "#2ECC71", "file not found": "#E74C3C", "cannot open media": "#E74C3C", "invalid fps (0)": "#E74C3C", "FFProbe Error": "#E74C3C", "time format error": "#E67E22", "out time < in time": "#E67E22", "gap": "#F1C40F", "skipped": "#F1C40F"}
@@ -417,146 +1954,209 @@ class AutoCutApp(ctk.CTk):
         status_tag = status.replace(" ", "_"); parts.append((f"{status.upper()}", status_tag)); return parts
 
     def _update_csv_preview(self, rows_to_preview):
-        self.csv_preview_text.configure(state="normal"); self.csv_preview_text.delete("1.0", "end"); self._setup_preview_tags()
+        statuses = sorted({row.get('status', 'ok') for row in rows_to_preview}); framerates = sorted({row.get('framerate') for row in rows_to_preview if row.get('framerate')})
+        filter_values = ["Tất cả", "Chỉ lỗi"] + [f"FPS {fps}" for fps in framerates] + [f"Trạng thái: {status}" for status in statuses]
+        self.preview_filter_menu.configure(values=filter_values)
+        if self.preview_filter_var.get() not in filter_values: self.preview_filter_var.set("Tất cả")
+        self._preview_source = rows_to_preview; self._apply_preview_filter()
+
+    def _preview_row_matches(self, row):
+        selected = self.preview_filter_var.get()
+        if selected == "Chỉ lỗi": return is_error_row(row)
+        if selected.startswith("FPS "): return row.get('framerate') == selected[4:]
+        if selected.startswith("Trạng thái: "): return row.get('status', 'ok') == selected[len("Trạng thái: "):]
+        return True
+
+    def _apply_preview_filter(self):
+        self.preview_rows = [(i, row) for i, row in enumerate(self._preview_source) if self._preview_row_matches(row)]
+        self.preview_positions = {original_index: pos for pos, (original_index, _) in enumerate(self.preview_rows)}
+        self.preview_offset = 0; self._render_preview_page()
+
+    def _preview_page_size(self):
+        line_height = getattr(self, '_preview_line_height', None)
+        if line_height is None: line_height = self._preview_line_height = max(1, tkfont.Font(font=("Consolas", 11)).metrics('linespace'))
+        return max(1, self.csv_preview_text.winfo_height() // line_height - 2)
+
+    def _render_preview_page(self):
+        page_size = self._preview_page_size(); total = len(self.preview_rows)
+        self.preview_offset = max(0, min(self.preview_offset, total - page_size))
+        self.csv_preview_text.configure(state="normal"); self.csv_preview_text.delete("1.0", "end")
         header = f"{ 'STT':<4} | {'FILENAME':<28} | {'TIMECODE':<22} | {'CODEC':<7} | {'FPS':<8} | {'COLOR':<10} | {'DURATION':<9} | {'STATUS'}\n";
         sep = "-" * (len(header) + 5) + "\n"; self.csv_preview_text.insert("end", header, "default"); self.csv_preview_text.insert("end", sep, "default")
-        for i, row in enumerate(rows_to_preview):
-            line_parts = self._format_preview_row(row, i + 1)
-            for text, tag in line_parts: self.csv_preview_text.insert("end", text, tag)
+        for original_index, row in self.preview_rows[self.preview_offset:self.preview_offset + page_size]:
+            for text, tag in self._format_preview_row(row, original_index + 1): self.csv_preview_text.insert("end", text, tag)
             self.csv_preview_text.insert("end", "\n", "default")
+        self.csv_preview_text.configure(state="disabled"); self._prefetch_thumbnails(page_size)
+        if total: self.preview_scrollbar.set(self.preview_offset / total, min(1.0, (self.preview_offset + page_size) / total))
+        else: self.preview_scrollbar.set(0, 1)
+
+    def _refresh_preview_row(self, original_index):
+        row = self.processed_data[original_index]; position = self.preview_positions.get(original_index)
+        if (position is not None) != self._preview_row_matches(row): offset = self.preview_offset; self._apply_preview_filter(); self.preview_offset = offset; self._render_preview_page(); return
+        if position is None: return
+        self.preview_rows[position] = (original_index, row)
+        if not self.preview_offset <= position < self.preview_offset + self._preview_page_size(): return
+        line = position - self.preview_offset + 3
+        self.csv_preview_text.configure(state="normal"); self.csv_preview_text.delete(f"{line}.0", f"{line}.end")
+        for text, tag in reversed(self._format_preview_row(row, original_index + 1)): self.csv_preview_text.insert(f"{line}.0", text, tag)
         self.csv_preview_text.configure(state="disabled")
 
-    def _validate_row(self, row):
-        filename = row.get("filename", "").strip(); row['status'] = 'ok'; framerate = None; row['type'] = ''; row['codec'] = ''; row['color_profile'] = 'N/A'
-        if not filename: row['status'] = 'skipped'; return row, framerate
-        video_path = find_video_file(self.full_video_path, filename)
-        if video_path is None: row['status'] = 'File not found'; return row, framerate
-        row['full_path'] = video_path; row['type'] = 'clip'
+    def _poster_frame(self, row):
+        source = row.source
+        if not source.full_path: return None
         try:
-            metadata = get_video_metadata(video_path)
-            if metadata and metadata.get('streams'):
-                video_stream = next((s for s in metadata['streams'] if s.get('codec_type') == 'video'), None)
-                row['audio_tracks'] = sum(1 for s in metadata.get('streams', []) if s.get('codec_type') == 'audio')
-                start_timecode_str = '00:00:00:00'
-                if video_stream and 'tags' in video_stream: start_timecode_str = next((v for k, v in video_stream['tags'].items() if 'timecode' in k.lower()), start_timecode_str)
-                if 'format' in metadata and 'tags' in metadata['format']: start_timecode_str = next((v for k, v in metadata['format']['tags'].items() if 'timecode' in k.lower()), start_timecode_str)
-                row['start_timecode'] = start_timecode_str
-                if video_stream:
-                    row['codec'] = video_stream.get('codec_name', ''); row['width'] = video_stream.get('width', '1920'); row['height'] = video_stream.get('height', '1080')
-                    color_transfer = video_stream.get('color_transfer'); color_space = video_stream.get('color_space'); color_primaries = video_stream.get('color_primaries')
-                    if color_transfer and color_transfer not in ['unknown', 'bt709', 'smpte170m', 'bt470bg', 'bt601']: row['color_profile'] = color_transfer
-                    elif (color_transfer in ['smpte170m', 'bt601']) or (color_space in ['smpte170m', 'bt601']): row['color_profile'] = 'Rec.601'
-                    elif (color_transfer == 'bt709') or (color_space == 'bt709') or (color_primaries == 'bt709'): row['color_profile'] = 'Rec.709'
-                    else: row['color_profile'] = 'N/A'
-                else: row['codec'] = Path(filename).suffix
-                if video_stream:
-                    r_frame_rate = video_stream.get('r_frame_rate', '0/1')
-                    try: num, den = map(float, r_frame_rate.split('/')); fps = num / den if den != 0 else 0
-                    except (ValueError, ZeroDivisionError): fps = 0
-                    if not fps or fps == 0: row['status'] = 'Invalid FPS (0)'; return row, framerate
-                    row["framerate"] = f"{fps:.3f}"; framerate = round(fps, 3)
-                    nb_frames = video_stream.get('nb_frames')
-                    if nb_frames and int(nb_frames) > 0: row["duration_frames"] = str(int(nb_frames))
-                    elif 'duration' in video_stream: duration = float(video_stream.get('duration', '0')); row["duration_frames"] = str(int(duration * fps))
-                    else: row["duration_frames"] = '0'
-                else: row['type'] = 'title'; row['status'] = 'Cannot open media'; return row, framerate
-            else: row['codec'] = Path(filename).suffix; row['type'] = 'title'; row['status'] = 'Cannot open media'; return row, framerate
-        except Exception as e: row['type'] = 'title'; row['status'] = f'FFProbe Error: {e}'; return row, framerate
-        if row['status'] == 'ok' and row.get('type') == 'clip':
-            try:
-                in_f, out_f = parse_inout(row.get('Time in - time out', ''), float(row.get('framerate', 25.0)))
-                if in_f >= out_f: row['status'] = 'Out time < In time'
-            except (ValueError, TypeError):
-                row['status'] = 'Time format error'
-        return row, framerate
+            fps = source.framerate or 25.0; in_frame, _ = parse_inout(row.timecode, fps)
+            return source.full_path, max(0, in_frame - time_to_frames(source.start_timecode, fps)), fps
+        except (ValueError, TypeError): return None
+
+    def _load_thumbnail_image(self, path):
+        image = self._thumbnail_images.get(path)
+        if image is None:
+            try: image = tk.PhotoImage(file=str(path))
+            except tk.TclError: return None
+            if len(self._thumbnail_images) >= 512: self._thumbnail_images.pop(next(iter(self._thumbnail_images)))
+            self._thumbnail_images[path] = image
+        return image
+
+    def _prefetch_thumbnails(self, page_size):
+        if self._prefetch_job is not None: self.after_cancel(self._prefetch_job)
+        self._prefetch_job = self.after(THUMBNAIL_PREFETCH_DELAY_MS, self._run_prefetch, page_size) if self.show_thumbnails else None
+
+    def _run_prefetch(self, page_size):
+        self._prefetch_job = None; wanted = set()
+        for _, row in self.preview_rows[self.preview_offset:self.preview_offset + page_size]:
+            poster = self._poster_frame(row) if row.status == 'ok' else None
+            if poster: wanted.add(self.thumbnail_cache.prefetch(*poster))
+        self.thumbnail_cache.cancel_pending(keep=wanted)
+
+    def _on_preview_hover(self, event):
+        if not self.show_thumbnails: return
+        line = int(self.csv_preview_text.index(f"@{event.x},{event.y}").split('.')[0]); position = self.preview_offset + line - 3
+        if line < 3 or position >= min(len(self.preview_rows), self.preview_offset + self._preview_page_size()) or position == self._hovered_row: return
+        self._hovered_row = position; original_index, row = self.preview_rows[position]
+        self.preview_thumbnail_caption.configure(text=f"{original_index + 1}. {row.get('filename', '')}\n{row.get('Time in - time out', '')}"); self.preview_thumbnail_label.configure(image=self._blank_thumbnail)
+        poster = self._poster_frame(row) if row.get('status') == 'ok' else None
+        if poster: self.thumbnail_cache.request(*poster, callback=lambda path: self.after(0, self._show_preview_thumbnail, position, path))
+
+    def _show_preview_thumbnail(self, position, path):
+        if path is None or position != self._hovered_row: return
+        image = self._load_thumbnail_image(path)
+        if image is not None: self.preview_thumbnail_label.configure(image=image)
+
+    def destroy(self):
+        if self.watcher is not None: self.watcher.stop()
+        if self._thumbnail_cache is not None: self._thumbnail_cache.close()
+        if self._metadata_cache is not None: self._metadata_cache.flush()
+        super().destroy()
+
+    def _scroll_preview(self, rows):
+        self.preview_offset += rows; self._render_preview_page(); return "break"
+
+    def _on_preview_wheel(self, event): return self._scroll_preview(-3 if event.delta > 0 else 3)
+
+    def _on_preview_scroll(self, action, amount, unit=None):
+        page_size = self._preview_page_size()
+        if action == "moveto": self.preview_offset = int(float(amount) * len(self.preview_rows)); self._render_preview_page()
+        elif action == "scroll": self._scroll_preview(int(float(amount)) * (page_size if unit == "pages" else 1))
+
+    def _probe_variant(self): return probe_variant(self.probe_mode == 'light', self.native_probe)
+
+    def _probe_metadata(self, video_path):
+        light = self.probe_mode == 'light'; native = self.native_probe
+        return self.metadata_cache.get_or_probe(video_path, probe=lambda path: probe_media(path, light=light, native=native), variant=probe_variant(light, native))
+
+    def _validate_row(self, row, probe=None):
+        return validate_row(row, self._get_media_index().find, probe or self._probe_metadata, self.metadata_cache, self._probe_variant())
 
     def scan_data(self):
         if not all([self.full_csv_path, self.full_video_path]): messagebox.showerror("Ối!", "Bạn ơi, chọn file CSV và thư mục video trước đã nhé!"); self.log_message("Thiếu file CSV hoặc thư mục video!", 'error'); return
         self.scan_button.configure(state='disabled'); self.generate_button.configure(state='disabled')
         self.scan_progress_label.grid(); self.scan_progress_bar.grid(); self.scan_progress_bar.set(0); self.scan_progress_label.configure(text="Chuẩn bị quét..."); self.update_idletasks()
-        scan_thread = threading.Thread(target=self.threaded_scan_data); scan_thread.start()
+        self.scan_progress = ProgressReporter(unit='dòng'); self._start_trace()
+        scan_thread = threading.Thread(target=TRACER.profiled(self.threaded_scan_data)); scan_thread.start()
+        sample_progress(self, self.scan_progress, self.scan_progress_bar, self.scan_progress_label, "Đang quét")
+
+    def _make_shared_probe(self): return make_shared_probe(self._probe_metadata)
+
+    def _row_fingerprint(self, row, media_index, file_stats):
+        filename = row.get('filename', '').strip(); video_path = media_index.find(filename) if filename else None
+        if video_path not in file_stats:
+            try: st = os.stat(video_path); file_stats[video_path] = [st.st_size, st.st_mtime_ns]
+            except (OSError, TypeError): file_stats[video_path] = None
+        return ScanStateStore.row_fingerprint(row, video_path, file_stats[video_path], self._probe_variant())
+
+    def _scan_rows(self, rows, media_index, progress):
+        num_rows = len(rows); results = [None] * num_rows; row_framerates = [None] * num_rows; progress.total = num_rows
+        with TRACER.span('scan.state_load'): stored_rows = self.scan_state.load(self.full_csv_path)
+        file_stats = {}; fingerprints = []; pending = []; fingerprint_started_ns = time.perf_counter_ns()
+        for i, row in enumerate(rows):
+            fingerprint = self._row_fingerprint(row, media_index, file_stats); fingerprints.append(fingerprint)
+            if fingerprint in stored_rows: data, framerate = stored_rows[fingerprint]; results[i] = ScanRow.from_dict(data); row_framerates[i] = framerate
+            else: pending.append(i)
+        TRACER.record('scan.fingerprint', fingerprint_started_ns, time.perf_counter_ns()); reused_count = num_rows - len(pending)
+        if reused_count: self.log_message(f"Bỏ qua {reused_count} dòng không thay đổi, kiểm tra lại {len(pending)} dòng."); progress.advance(reused_count)
+        probe_once = self._make_shared_probe()
+        @TRACER.profiled
+        def validate_and_report(row):
+            result = self._validate_row(row, probe_once); progress.advance(1, Path(row.get('filename', 'N/A')).name); return result
+        with ThreadPoolExecutor(max_workers=self.scan_workers) as pool:
+            futures = {pool.submit(validate_and_report, rows[i]): i for i in pending}
+            for future in as_completed(futures):
+                i = futures[future]; results[i], row_framerates[i] = future.result()
+        with TRACER.span('scan.state_save'): self.scan_state.save(self.full_csv_path, zip(fingerprints, results, row_framerates))
+        return results, row_framerates
 
     def threaded_scan_data(self):
         try:
-            rows = self._read_csv_rows()
+            with TRACER.span('scan.read_script'): rows = self._read_csv_rows()
             if not rows: self.after(0, self.finish_scan, None); return
-            self.after(0, self.log_message, "Bắt đầu quét và xác thực dữ liệu...")
-            self.processed_data = []; scanned_framerates = []
-            num_rows = len(rows)
-            for i, row in enumerate(rows):
-                progress = (i + 1) / num_rows; filename = Path(row.get('filename', 'N/A')).name
-                self.after(0, self.update_scan_progress, progress, f"Đang quét {i+1}/{num_rows}: {filename}")
-                validated_row, framerate = self._validate_row(row)
-                self.processed_data.append(validated_row)
-                if framerate: scanned_framerates.append(framerate)
+            self.log_message(f"Bắt đầu quét và xác thực dữ liệu ({self.scan_workers} luồng)...")
+            self.metadata_cache.reset_stats(); media_index = self._refresh_media_index()
+            self.log_message(f"Chỉ mục media: {len(media_index)} file trong {Path(media_index.root).name}")
+            results, row_framerates = self._scan_rows(rows, media_index, self.scan_progress)
+            self.processed_data = results
+            scanned_framerates = [fps for fps in row_framerates if fps]
             if scanned_framerates: self.most_common_fps = Counter(scanned_framerates).most_common(1)[0][0]
+            self.metadata_cache.flush()
             self.after(0, self.finish_scan, self.processed_data)
         except Exception as e: self.after(0, self.finish_scan, e)
-
-    def update_scan_progress(self, progress, message): self.scan_progress_bar.set(progress); self.scan_progress_label.configure(text=message)
+        finally: self.scan_progress.finish()
 
     def finish_scan(self, result):
+        try: self._finish_scan(result)
+        finally: self._report_trace("scan")
+
+    def _finish_scan(self, result):
         self.scan_progress_label.grid_remove(); self.scan_progress_bar.grid_remove(); self.scan_button.configure(state='normal')
         if isinstance(result, Exception): messagebox.showerror("Lỗi khi quét!", f"Đã có lỗi xảy ra:\n{result}"); self.log_message(f"Lỗi khi quét data: {result}", 'error'); return
         if result is None: self.log_message("CSV rỗng hoặc không đọc được dữ liệu.", 'error'); return
         self.log_message(f"FPS phổ biến nhất trong media là: {self.most_common_fps}")
+        self.log_message(f"Cache metadata: {self.metadata_cache.hits} lần dùng lại, {self.metadata_cache.misses} lần chạy ffprobe")
         self._update_csv_preview(self.processed_data)
-        error_rows = [(i, row) for i, row in enumerate(self.processed_data) if row.get('status') not in ['ok', 'skipped', 'gap'] and row.get('filename')]
-        if error_rows: self.log_message(f"Tìm thấy {len(error_rows)} lỗi. Mở trình chỉnh sửa..."); editor = ErrorEditorDialog(self, error_rows); self.wait_window(editor); self._update_csv_preview(self.processed_data)
+        error_rows = [(i, row) for i, row in enumerate(self.processed_data) if is_error_row(row)]
+        if error_rows:
+            self.log_message(f"Tìm thấy {len(error_rows)} lỗi. Mở trình chỉnh sửa...")
+            with TRACER.span('error_editor', errors=len(error_rows)): editor = ErrorEditorDialog(self, error_rows); self.wait_window(editor)
+            self._update_csv_preview(self.processed_data); self.metadata_cache.flush()
         try:
-            with open(self.full_csv_path, 'w', newline='', encoding='utf-8-sig') as f:
-                writer = csv.DictWriter(f, fieldnames=self.CANONICAL_HEADERS, extrasaction='ignore')
-                writer.writeheader(); writer.writerows(self.processed_data)
+            self._write_processed_csv()
             self.log_message("Quét và cập nhật CSV thành công!", 'success')
 
             # --- USER WARNING ---
-            self.console_text.configure(state="normal")
-            separator = "\n" + "="*70 + "\n"
-            self.console_text.insert("end", separator, "default")
-            
-            warning_tag = "warning_highlight"
-            self.console_text.tag_config(warning_tag, background="yellow", foreground="black", justify='center')
-            
-            warning_message = "Phiên Bản Google sheet đọc data éo chính xác đâu bro! đtao đang mò dở đoạn đấy nên tốt nhất là tạm thời tự check số lượng clip rồi fill thêm vào CSV sau bước này dùm tao hehe !"
-            self.console_text.insert("end", f"\n{warning_message}\n\n", warning_tag)
-            
-            self.console_text.insert("end", "="*70 + "\n", "default")
-            self.console_text.see("end")
-            self.console_text.configure(state="disabled")
+            warning_message = "Phiên Bản Google sheet đọc data éo chính xác đâu bro! đtao đang mò dở đoạn đấy nên tốt nhất là tạm thời tự check số lượng clip rồi fill thêm vào CSV sau bước này dùm tao hehe !"
+            self.log_queue.put(("\n" + "="*70 + "\n", "default")); self.log_queue.put((f"\n{warning_message}\n\n", "warning_highlight")); self.log_queue.put(("="*70 + "\n", "default"))
             # --- END USER WARNING ---
 
             self.generate_button.configure(state="normal")
         except Exception as e: messagebox.showerror("Lỗi khi lưu CSV!", f"Không thể ghi lại file CSV:\n{e}"); self.log_message(f"Lỗi ghi file CSV: {e}", 'error')
 
-    def _write_xml_to_file(self, xmeml_element, file_path):
-        xml_string = ET.tostring(xmeml_element, 'utf-8')
-        pretty_xml = minidom.parseString(xml_string).toprettyxml(indent="  ")
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(pretty_xml)
-
-    def _create_xml_scaffold(self, sequence_name, timeline_fps, width, height):
-        xmeml = ET.Element("xmeml", version="4"); sequence = ET.SubElement(xmeml, "sequence", id="sequence-1"); ET.SubElement(sequence, "name").text = sequence_name
-        rate_seq = ET.SubElement(sequence, "rate"); ET.SubElement(rate_seq, "timebase").text = str(round(timeline_fps)); ET.SubElement(rate_seq, "ntsc").text = "FALSE"
-        media = ET.SubElement(sequence, "media"); video = ET.SubElement(media, "video"); vid_format = ET.SubElement(video, "format"); vid_sample_chars = ET.SubElement(vid_format, "samplecharacteristics")
-        rate_format = ET.SubElement(vid_sample_chars, "rate"); ET.SubElement(rate_format, "timebase").text = str(round(timeline_fps)); ET.SubElement(vid_sample_chars, "width").text = width; ET.SubElement(vid_sample_chars, "height").text = height; ET.SubElement(vid_sample_chars, "pixelaspectratio").text = "square"
-        video_track = ET.SubElement(video, "track"); audio = ET.SubElement(media, "audio"); timeline_audio_tracks = [ET.SubElement(audio, "track") for _ in range(8)]
-        return xmeml, sequence, video_track, timeline_audio_tracks
-
-    def _create_file_node(self, row, file_id):
-        source_fps = float(row.get('framerate')); video_path = Path(row.get('full_path')); file_duration = int(row.get('duration_frames', 0)); start_timecode_str = row.get('start_timecode', '00:00:00:00'); start_offset_frames = time_to_frames(start_timecode_str, source_fps); num_audio_tracks_in_file = row.get('audio_tracks', 0); video_width = row.get('width', '1920'); video_height = row.get('height', '1080')
-        file_el = ET.Element("file", id=file_id); ET.SubElement(file_el, "name").text = video_path.name; path_uri = video_path.as_uri(); formatted_uri = path_uri.replace('file:///', 'file://localhost/').replace(':', '%3a', 1); ET.SubElement(file_el, "pathurl").text = formatted_uri; ET.SubElement(file_el, "duration").text = str(file_duration)
-        timecode_el = ET.SubElement(file_el, "timecode"); tc_rate = ET.SubElement(timecode_el, "rate"); ET.SubElement(tc_rate, "timebase").text = str(round(source_fps)); is_ntsc = '29.97' in str(source_fps) or '59.94' in str(source_fps); ET.SubElement(tc_rate, "ntsc").text = "TRUE" if is_ntsc else "FALSE"; ET.SubElement(timecode_el, "string").text = start_timecode_str; ET.SubElement(timecode_el, "frame").text = str(int(start_offset_frames)); ET.SubElement(timecode_el, "displayformat").text = "DF" if is_ntsc else "NDF"
-        media_el = ET.SubElement(file_el, "media"); vid_media_el = ET.SubElement(media_el, "video"); vid_sample_chars = ET.SubElement(vid_media_el, "samplecharacteristics"); rate_el = ET.SubElement(vid_sample_chars, "rate"); ET.SubElement(rate_el, "timebase").text = str(round(source_fps)); ET.SubElement(vid_sample_chars, "width").text = str(video_width); ET.SubElement(vid_sample_chars, "height").text = str(video_height)
-        aud_media_el = ET.SubElement(media_el, "audio"); ET.SubElement(aud_media_el, "channelcount").text = str(num_audio_tracks_in_file) if num_audio_tracks_in_file > 0 else "2"
-        return file_el
-
-    def _link_clip_group(self, clip_group, clip_count):
-        for source_item, _, _ in clip_group:
-            for target_item, target_type, target_track_idx in clip_group:
-                link = ET.SubElement(source_item, "link"); ET.SubElement(link, "linkclipref").text = target_item.get("id"); ET.SubElement(link, "mediatype").text = target_type; ET.SubElement(link, "trackindex").text = str(target_track_idx); ET.SubElement(link, "clipindex").text = str(clip_count)
-                if source_item.get("id") != target_item.get("id"): ET.SubElement(link, "groupindex").text = "1"
+    def _write_processed_csv(self):
+        with TRACER.span('csv.write'), open(self.full_csv_path, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.DictWriter(f, fieldnames=self.CANONICAL_HEADERS, extrasaction='ignore')
+            writer.writeheader(); writer.writerows(self.processed_data)
 
     def finish_generate_xml(self, success, result):
+        self.scan_progress_label.grid_remove(); self.scan_progress_bar.grid_remove(); self._report_trace("xml")
         if success:
             message = result; self.log_message(message, 'success'); messagebox.showinfo("Xong!", f"File XML của bạn đã sẵn sàng tại:\n{self.full_xml_path}")
             try:
@@ -568,60 +2168,358 @@ class AutoCutApp(ctk.CTk):
         else: error = result; messagebox.showerror("Ôi không!", f"Đã có lỗi nghiêm trọng xảy ra khi tạo XML:\n{error}"); self.log_message(f"Lỗi rồi bạn ơi: {error}", 'error')
         self.scan_button.configure(state='normal'); self.generate_button.configure(state='normal'); self.log_message("Sẵn sàng cho lần chạy tiếp theo.")
 
+    def _sequence_settings(self):
+        selected_res = self.resolution_var.get()
+        if selected_res == "Tùy chỉnh...":
+            w_str = self.custom_width_entry.get(); h_str = self.custom_height_entry.get()
+            if not w_str.isdigit() or not h_str.isdigit() or int(w_str) == 0 or int(h_str) == 0: raise ValueError("Width và Height tùy chỉnh phải là các số hợp lệ và lớn hơn 0.")
+            width, height = w_str, h_str
+        else: width, height = self.resolution_map[selected_res]
+        return width, height, self.fps_map[self.fps_var.get()]
+
     def threaded_generate_xml(self):
         try:
-            selected_res = self.resolution_var.get()
-            if selected_res == "Tùy chỉnh...":
-                w_str = self.custom_width_entry.get(); h_str = self.custom_height_entry.get()
-                if not w_str.isdigit() or not h_str.isdigit() or int(w_str) == 0 or int(h_str) == 0: raise ValueError("Width và Height tùy chỉnh phải là các số hợp lệ và lớn hơn 0.")
-                width, height = w_str, h_str
-            else: width, height = self.resolution_map[selected_res]
-            selected_fps_str = self.fps_var.get(); timeline_fps_val = self.fps_map[selected_fps_str]
+            width, height, timeline_fps_val = self._sequence_settings()
             TIMELINE_FPS = self.most_common_fps if timeline_fps_val == 'auto' else timeline_fps_val
             self.log_message(f"Tạo XML với Resolution: {width}x{height}, FPS: {TIMELINE_FPS}")
             sequence_name = Path(self.full_csv_path).stem + "_FinalSequence"
-            xmeml, sequence, video_track, timeline_audio_tracks = self._create_xml_scaffold(sequence_name, TIMELINE_FPS, width, height)
-            total_duration_on_timeline = 0; clip_count = 0
-            for row in self.processed_data:
-                if row.get('type') == 'gap' and row.get('status') == 'gap':
-                    try:
-                        in_f, out_f = parse_inout(row.get('Time in - time out', ''), TIMELINE_FPS)
-                        gap_duration_frames = out_f - in_f
-                        if gap_duration_frames > 0: 
-                            total_duration_on_timeline += gap_duration_frames
-                    except: 
-                        continue
-                    continue
-                if row.get('status') != 'ok' or row.get('type') != 'clip': continue
-                try:
-                    source_fps = float(row.get('framerate')); in_frame_raw, out_frame_raw = parse_inout(row.get('Time in - time out', ''), source_fps); file_duration = int(row.get('duration_frames', 0)); start_timecode_str = row.get('start_timecode', '00:00:00:00'); start_offset_frames = time_to_frames(start_timecode_str, source_fps)
-                    in_frame = max(0, in_frame_raw - start_offset_frames); out_frame = min(file_duration, out_frame_raw - start_offset_frames)
-                    if in_frame >= out_frame: continue
-                    clip_duration_source_frames = out_frame - in_frame; clip_duration_timeline_frames = round(clip_duration_source_frames * (TIMELINE_FPS / source_fps))
-                    if clip_duration_timeline_frames <= 0: continue
-                    clip_count += 1; file_id = f"file_{clip_count}"; clip_name = row.get('filename', '').strip()
-                    file_el = self._create_file_node(row, file_id)
-                    vid_clipitem = ET.SubElement(video_track, "clipitem", id=f"vid_clip_{clip_count}"); ET.SubElement(vid_clipitem, "name").text = clip_name; ET.SubElement(vid_clipitem, "start").text = str(total_duration_on_timeline); ET.SubElement(vid_clipitem, "end").text = str(total_duration_on_timeline + clip_duration_timeline_frames); ET.SubElement(vid_clipitem, "in").text = str(in_frame); ET.SubElement(vid_clipitem, "out").text = str(out_frame); vid_clipitem.append(file_el)
-                    clip_group = [(vid_clipitem, 'video', 1)]
-                    num_audio_tracks_in_file = row.get('audio_tracks', 0)
-                    for j in range(min(num_audio_tracks_in_file, 8)):
-                        aud_clipitem = ET.SubElement(timeline_audio_tracks[j], "clipitem", id=f"aud_clip_{clip_count}_{j+1}"); ET.SubElement(aud_clipitem, "name").text = clip_name; ET.SubElement(aud_clipitem, "start").text = str(total_duration_on_timeline); ET.SubElement(aud_clipitem, "end").text = str(total_duration_on_timeline + clip_duration_timeline_frames); ET.SubElement(aud_clipitem, "in").text = str(in_frame); ET.SubElement(aud_clipitem, "out").text = str(out_frame); ET.SubElement(aud_clipitem, "file", id=file_id)
-                        sourcetrack = ET.SubElement(aud_clipitem, "sourcetrack"); ET.SubElement(sourcetrack, "mediatype").text = "audio"; ET.SubElement(sourcetrack, "trackindex").text = str(j + 1); clip_group.append((aud_clipitem, 'audio', j + 1))
-                    self._link_clip_group(clip_group, clip_count)
-                    total_duration_on_timeline += clip_duration_timeline_frames
-                except (ValueError, TypeError, KeyError) as e: self.log_message(f"Lỗi xử lý dòng cho clip '{row.get('filename')}': {e}. Bỏ qua.", 'error'); continue
-            ET.SubElement(sequence, "duration").text = str(total_duration_on_timeline)
-            self._write_xml_to_file(xmeml, self.full_xml_path)
-            success_message = f"Voilà! Đã tạo xong file XML: {Path(self.full_xml_path).name} với {clip_count} clip."
+            timeline = build_timeline(self.processed_data, TIMELINE_FPS, self.log_message, self.generate_progress)
+            written = export_timeline(timeline, self.full_xml_path, sequence_name, width, height, self.export_formats)
+            success_message = f"Voilà! Đã tạo xong file XML: {Path(self.full_xml_path).name} với {timeline.clip_count} clip." + (f" Kèm theo: {', '.join(path.name for path in written[1:])}" if len(written) > 1 else "")
             self.after(0, self.finish_generate_xml, True, success_message)
         except Exception as e: self.after(0, self.finish_generate_xml, False, e)
+        finally: self.generate_progress.finish()
 
     def generate_xml(self):
         if not self.full_xml_path: messagebox.showerror("Ối!", "Bạn ơi, chưa chọn nơi lưu file XML!"); return
         if not self.processed_data: messagebox.showerror("Ối!", "Chưa có dữ liệu để tạo XML. Hãy Scan trước nhé!"); return
-        self.scan_button.configure(state='disabled'); self.generate_button.configure(state='disabled'); self.update_idletasks()
-        xml_thread = threading.Thread(target=self.threaded_generate_xml); xml_thread.start()
+        self.scan_button.configure(state='disabled'); self.generate_button.configure(state='disabled')
+        self.scan_progress_label.grid(); self.scan_progress_bar.grid(); self.scan_progress_bar.set(0); self.scan_progress_label.configure(text="Đang tạo XML..."); self.update_idletasks()
+        self.generate_progress = ProgressReporter(total=len(self.processed_data), unit='dòng'); self._start_trace()
+        xml_thread = threading.Thread(target=TRACER.profiled(self.threaded_generate_xml)); xml_thread.start()
+        sample_progress(self, self.generate_progress, self.scan_progress_bar, self.scan_progress_label, "Đang tạo XML")
+
+    def scan_and_generate(self):
+        if not all([self.full_csv_path, self.full_video_path, self.full_xml_path]): messagebox.showerror("Ối!", "Cần chọn file CSV, thư mục video và nơi lưu XML trước đã nhé!"); return
+        try: sequence_settings = self._sequence_settings()
+        except ValueError as e: messagebox.showerror("Lỗi", str(e)); return
+        for button in (self.scan_button, self.generate_button, self.pipeline_button, self.watch_button): button.configure(state='disabled')
+        self.scan_progress_label.grid(); self.scan_progress_bar.grid(); self.scan_progress_bar.set(0); self.scan_progress_label.configure(text="Chuẩn bị quét & tạo XML..."); self.update_idletasks()
+        self.scan_progress = ProgressReporter(unit='dòng'); self._start_trace()
+        pipeline_thread = threading.Thread(target=TRACER.profiled(self.threaded_scan_and_generate), args=sequence_settings); pipeline_thread.start()
+        sample_progress(self, self.scan_progress, self.scan_progress_bar, self.scan_progress_label, "Đang quét & tạo XML")
+
+    def threaded_scan_and_generate(self, width, height, timeline_fps_val):
+        writer = None; started = time.perf_counter()
+        try:
+            self.log_message(f"Bắt đầu quét và tạo XML liền mạch ({self.scan_workers} luồng)...")
+            self.metadata_cache.reset_stats(); media_index = self._refresh_media_index(); probe_once = self._make_shared_probe()
+            with TRACER.span('scan.state_load'): stored_rows = self.scan_state.load(self.full_csv_path)
+            file_stats = {}; entries = []; progress = self.scan_progress; sequence_name = Path(self.full_csv_path).stem + "_FinalSequence"
+            @TRACER.profiled
+            def resolve(row):
+                fingerprint = self._row_fingerprint(row, media_index, file_stats); stored = stored_rows.get(fingerprint)
+                if stored is not None: row, framerate = ScanRow.from_dict(stored[0]), stored[1]
+                else: row, framerate = self._validate_row(row, probe_once)
+                entries.append((fingerprint, row.copy(), framerate)); progress.advance(1, Path(row.filename or 'N/A').name); return row, framerate
+            if timeline_fps_val != 'auto' and 'xmeml' in self.export_formats: writer = XmemlWriter(self.full_xml_path, sequence_name, timeline_fps_val, width, height)
+            elif timeline_fps_val == 'auto': self.log_message("FPS timeline là 'auto': XML sẽ được ghi sau khi biết FPS phổ biến nhất.")
+            processed, framerates, timeline = run_scan_pipeline(self._iter_script_rows(), resolve, timeline_fps_val, self.scan_workers, self.log_message, progress, writer.add_event if writer else None)
+            if not processed: raise ValueError("CSV rỗng hoặc không đọc được dữ liệu.")
+            formats = tuple(export_format for export_format in self.export_formats if writer is None or export_format != 'xmeml')
+            if writer is not None:
+                with TRACER.span('xml.finalize'): writer.close(timeline.duration)
+                writer = None
+            written = export_timeline(timeline, self.full_xml_path, sequence_name, width, height, formats)
+            xml_seconds = time.perf_counter() - started; self.processed_data = processed
+            if framerates: self.most_common_fps = Counter(framerates).most_common(1)[0][0]
+            self.metadata_cache.flush()
+            with TRACER.span('scan.state_save'): self.scan_state.save(self.full_csv_path, entries)
+            self._write_processed_csv(); gap_count = sum(1 for row in processed if row.status == 'gap'); extra_files = [path.name for path in written if path != Path(self.full_xml_path)]
+            message = f"Đã quét {len(processed)} dòng và tạo {Path(self.full_xml_path).name} với {timeline.clip_count} clip (FPS {timeline.fps}) sau {xml_seconds:.1f}s." + (f" {gap_count} dòng lỗi đã được thay bằng khoảng trống." if gap_count else "") + (f" Kèm theo: {', '.join(extra_files)}" if extra_files else "")
+            self.after(0, self.finish_scan_and_generate, True, message)
+        except Exception as e:
+            if writer is not None: writer.abort()
+            self.after(0, self.finish_scan_and_generate, False, e)
+        finally: self.scan_progress.finish()
+
+    def finish_scan_and_generate(self, success, result):
+        self.scan_progress_label.grid_remove(); self.scan_progress_bar.grid_remove(); self._report_trace("pipeline")
+        for button in (self.scan_button, self.pipeline_button, self.watch_button): button.configure(state='normal')
+        self.generate_button.configure(state='normal' if self.processed_data else 'disabled')
+        if not success: messagebox.showerror("Ôi không!", f"Đã có lỗi xảy ra khi quét & tạo XML:\n{result}"); self.log_message(f"Lỗi khi quét & tạo XML: {result}", 'error'); return
+        self.log_message(result, 'success'); self._update_csv_preview(self.processed_data)
+
+    def toggle_watch(self):
+        if self.watcher is not None:
+            self.watcher.stop(); self.watcher = None; self.watch_button.configure(text="👁 Theo dõi thay đổi")
+            self.scan_button.configure(state='normal'); self.pipeline_button.configure(state='normal'); self.generate_button.configure(state='normal' if self.processed_data else 'disabled'); self.log_message("Đã dừng theo dõi thay đổi."); return
+        if not all([self.full_csv_path, self.full_video_path, self.full_xml_path]): messagebox.showerror("Ối!", "Cần chọn file CSV, thư mục video và nơi lưu XML trước khi theo dõi!"); return
+        if not os.path.exists(self.full_csv_path): messagebox.showerror("Ối!", "File CSV chưa tồn tại trên ổ đĩa. Hãy Scan một lần để lưu CSV trước nhé!"); return
+        try: width, height, timeline_fps_val = self._sequence_settings()
+        except ValueError as e: messagebox.showerror("Lỗi", str(e)); return
+        self._watch_settings = (width, height, timeline_fps_val, tuple(self.export_formats)); self._watch_rows = list(self.processed_data); self._watch_timeline = None
+        self.scan_button.configure(state='disabled'); self.generate_button.configure(state='disabled'); self.pipeline_button.configure(state='disabled'); self.watch_button.configure(text="⏹ Dừng theo dõi")
+        self.log_message(f"Bắt đầu theo dõi {Path(self.full_csv_path).name} và {Path(self.full_video_path).name}...")
+        stale = self._watch_output_stale()
+        if not stale: self.log_message(f"{Path(self.full_xml_path).name} đã mới hơn kịch bản và thư mục video, chờ thay đổi tiếp theo.")
+        self.watcher = FileWatcher(self._watch_signature, self._watch_rebuild, initial=stale).start()
+
+    def _watch_output_stale(self):
+        try: xml_mtime = os.stat(self.full_xml_path).st_mtime_ns
+        except OSError: return True
+        inputs = [os.stat(self.full_csv_path).st_mtime_ns] + [mtime or 0 for _, mtime in self._get_media_index().directory_mtimes()]
+        return not self._watch_rows or max(inputs) > xml_mtime
+
+    def _watch_signature(self):
+        try: st = os.stat(self.full_csv_path); script_stat = (st.st_size, st.st_mtime_ns)
+        except OSError: script_stat = None
+        media_files = []
+        for path in sorted({row.get('full_path') for row in self._watch_rows if row.get('full_path')}):
+            try: st = os.stat(path); media_files.append((path, st.st_size, st.st_mtime_ns))
+            except OSError: media_files.append((path, None, None))
+        return script_stat, self._get_media_index().directory_mtimes(), tuple(media_files)
+
+    def _watch_rebuild(self):
+        TRACER.enabled = self.trace_enabled; TRACER.reset()
+        try:
+            with TRACER.span('scan.read_script'): rows = read_csv_rows(self.full_csv_path, self.log_message)
+            if not rows: return
+            media_index = self._refresh_media_index(); results, row_framerates = self._scan_rows(rows, media_index, ProgressReporter(unit='dòng'))
+            self.metadata_cache.flush(); width, height, timeline_fps_val, formats = self._watch_settings
+            scanned_framerates = [fps for fps in row_framerates if fps]
+            if scanned_framerates: self.most_common_fps = Counter(scanned_framerates).most_common(1)[0][0]
+            timeline_fps = self.most_common_fps if timeline_fps_val == 'auto' else timeline_fps_val
+            previous_rows = self._watch_rows; previous = self._watch_timeline
+            first_changed_row = next((i for i, (old, new) in enumerate(zip(previous_rows, results)) if old != new), min(len(previous_rows), len(results)))
+            if previous is not None and previous.fps == timeline_fps and first_changed_row == len(previous_rows) == len(results): return
+            timeline = build_timeline(results, timeline_fps, self.log_message, previous=previous, first_changed_row=first_changed_row)
+            sequence_name = Path(self.full_csv_path).stem + "_FinalSequence"; export_timeline(timeline, self.full_xml_path, sequence_name, width, height, formats)
+            self._watch_rows = results; self._watch_timeline = timeline; self.processed_data = results
+            error_count = sum(1 for row in results if is_error_row(row))
+            self.log_message(f"Theo dõi: đã cập nhật {Path(self.full_xml_path).name} từ dòng {first_changed_row + 1} ({timeline.clip_count} clip, FPS {timeline_fps})." + (f" {error_count} dòng lỗi bị bỏ qua." if error_count else ""), 'success')
+            self.after(0, self._update_csv_preview, results)
+        except Exception as e: self.log_message(f"Lỗi khi theo dõi thay đổi: {e}", 'error')
+
+# --- Headless Batch Mode ---
+def _batch_process_script(job):
+    started = time.perf_counter(); script_path = Path(job['script_path']); options = job['options']
+    find_file = job['resolved'].get; probe = job['probe_results'].get
+    processed = []; framerates = []
+    for row in job['rows']:
+        validated_row, framerate = validate_row(row, find_file, probe); processed.append(validated_row)
+        if framerate: framerates.append(framerate)
+    most_common_fps = Counter(framerates).most_common(1)[0][0] if framerates else 25.0
+    errors = [{'row': i + 1, 'filename': row.get('filename'), 'status': row.get('status')} for i, row in enumerate(processed) if is_error_row(row)]
+    for row in processed:
+        if is_error_row(row): mark_as_gap(row)
+    timeline_fps = most_common_fps if options['fps'] == 'auto' else options['fps']
+    xml_path = Path(options['out_dir']) / f"{script_path.stem}_Final.xml"; warnings = []
+    timeline = build_timeline(processed, timeline_fps, lambda message, status_type=None: warnings.append(message)); clip_count = timeline.clip_count
+    written = export_timeline(timeline, xml_path, script_path.stem + "_FinalSequence", options['width'], options['height'], options.get('formats', ('xmeml',)))
+    return {'script': str(script_path), 'xml': str(xml_path), 'exports': [str(path) for path in written], 'rows': len(processed), 'clips': clip_count, 'gaps': sum(1 for row in processed if row.get('status') == 'gap'), 'timeline_fps': timeline_fps, 'errors': errors, 'warnings': warnings, 'seconds': round(time.perf_counter() - started, 3)}
+
+def run_batch(argv):
+    import argparse
+    parser = argparse.ArgumentParser(prog="Snipsnip.py batch", description="Tạo XML hàng loạt từ các kịch bản CSV mà không cần mở giao diện.")
+    parser.add_argument('scripts', help="Thư mục chứa các file kịch bản .csv (hoặc một file .csv)")
+    parser.add_argument('--video', required=True, help="Thư mục chứa source video")
+    parser.add_argument('--out', help="Thư mục lưu XML (mặc định: cạnh kịch bản)")
+    parser.add_argument('--recursive', action='store_true', help="Tìm cả trong thư mục con của thư mục video")
+    parser.add_argument('--fps', default='auto', help="FPS timeline: auto hoặc một số, ví dụ 25 / 29.97")
+    parser.add_argument('--resolution', default='1920x1080', help="Kích thước sequence, dạng WIDTHxHEIGHT")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 4, help="Số tiến trình xử lý kịch bản song song")
+    parser.add_argument('--probe-workers', type=int, default=os.cpu_count() or 4, help="Số luồng chạy ffprobe song song")
+    parser.add_argument('--full-probe', action='store_true', help="Dùng ffprobe đầy đủ thay vì chế độ nhẹ")
+    parser.add_argument('--no-native-probe', action='store_true', help="Luôn chạy ffprobe, không tự đọc header MP4/MOV")
+    parser.add_argument('--formats', default='xmeml', help="Định dạng xuất, cách nhau bởi dấu phẩy: " + ", ".join(EXPORTERS))
+    parser.add_argument('--summary', help="Đường dẫn file JSON tổng kết (mặc định: batch_summary.json trong thư mục XML)")
+    args = parser.parse_args(argv)
+    res_match = re.fullmatch(r'(\d+)[xX](\d+)', args.resolution)
+    if not res_match or '0' in (res_match.group(1), res_match.group(2)): parser.error("--resolution phải có dạng WIDTHxHEIGHT, ví dụ 1920x1080")
+    try: fps = 'auto' if args.fps == 'auto' else float(args.fps)
+    except ValueError: parser.error("--fps phải là 'auto' hoặc một số")
+    formats = [export_format.strip() for export_format in args.formats.split(',') if export_format.strip()]
+    if not formats or any(export_format not in EXPORTERS for export_format in formats): parser.error("--formats chỉ nhận: " + ", ".join(EXPORTERS))
+    scripts_root = Path(args.scripts)
+    script_paths = [scripts_root] if scripts_root.is_file() else sorted(scripts_root.glob('*.csv'))
+    if not script_paths: print(f"Không tìm thấy kịch bản .csv nào trong {scripts_root}"); return 2
+    out_dir = Path(args.out) if args.out else (scripts_root.parent if scripts_root.is_file() else scripts_root); out_dir.mkdir(parents=True, exist_ok=True)
+    config_dir = Path.home() / ".autocut_gui_config"; config_dir.mkdir(exist_ok=True)
+    media_index = MediaIndex(args.video, recursive=args.recursive); media_index.refresh()
+    print(f"Chỉ mục media: {len(media_index)} file trong {media_index.root}")
+    jobs = []; results = []
+    for script_path in script_paths:
+        try: rows = read_csv_rows(script_path, log=lambda message, status_type=None: None)
+        except (OSError, csv.Error, UnicodeDecodeError) as e: results.append({'script': str(script_path), 'error': f"Không đọc được kịch bản: {e}"}); continue
+        resolved = {}
+        for row in rows:
+            filename = row.get('filename', '').strip()
+            if filename and filename not in resolved: resolved[filename] = media_index.find(filename)
+        jobs.append({'script_path': str(script_path), 'rows': rows, 'resolved': resolved})
+    unique_paths = sorted({path for job in jobs for path in job['resolved'].values() if path})
+    metadata_cache = MetadataCache(config_dir / "metadata_cache.sqlite"); light = not args.full_probe
+    with ThreadPoolExecutor(max_workers=max(1, args.probe_workers)) as pool:
+        probe_results = dict(zip(unique_paths, pool.map(lambda path: metadata_cache.get_or_probe(path, probe=lambda p: probe_media(p, light=light, native=not args.no_native_probe), variant=probe_variant(light, not args.no_native_probe)), unique_paths)))
+    metadata_cache.flush()
+    print(f"Đã probe {len(unique_paths)} file nguồn cho {len(jobs)} kịch bản ({metadata_cache.hits} từ cache, {metadata_cache.misses} lần chạy ffprobe).")
+    options = {'fps': fps, 'width': res_match.group(1), 'height': res_match.group(2), 'out_dir': str(out_dir), 'formats': formats}
+    for job in jobs: job['probe_results'] = {path: probe_results[path] for path in job['resolved'].values() if path}; job['options'] = options
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        futures = {pool.submit(_batch_process_script, job): job['script_path'] for job in jobs}
+        for future in as_completed(futures):
+            try: result = future.result(); print(f"[OK] {Path(result['script']).name}: {result['clips']} clip, {result['gaps']} gap, {len(result['errors'])} lỗi -> {Path(result['xml']).name}")
+            except Exception as e: result = {'script': futures[future], 'error': str(e)}; print(f"[LỖI] {Path(futures[future]).name}: {e}")
+            results.append(result)
+    order = {str(path): i for i, path in enumerate(script_paths)}; results.sort(key=lambda result: order.get(result['script'], len(order)))
+    summary = {'video_folder': media_index.root, 'recursive': args.recursive, 'timeline_fps': args.fps, 'resolution': args.resolution, 'probed_files': len(unique_paths), 'cache_hits': metadata_cache.hits, 'cache_misses': metadata_cache.misses, 'scripts': results}
+    summary_path = Path(args.summary) if args.summary else out_dir / "batch_summary.json"
+    with open(summary_path, 'w', encoding='utf-8') as f: json.dump(summary, f, ensure_ascii=False, indent=2)
+    print(f"Đã ghi tổng kết: {summary_path}")
+    return 1 if any('error' in result for result in results) else 0
+
+# --- Native Probe Comparison ---
+PROBE_COMPARE_FIELDS = ('status', 'codec', 'width', 'height', 'framerate', 'duration_frames', 'start_timecode', 'audio_tracks', 'color_profile')
+
+def compare_probe_paths(video_path):
+    started = time.perf_counter(); native = read_mp4_header(video_path); native_seconds = time.perf_counter() - started
+    started = time.perf_counter(); reference = get_video_metadata(video_path); ffprobe_seconds = time.perf_counter() - started
+    def derive(metadata):
+        row = {'filename': Path(video_path).name, 'Time in - time out': '0:00-0:01'}; validate_row(row, lambda _: str(video_path), lambda _: metadata)
+        return {field: row.get(field) for field in PROBE_COMPARE_FIELDS}
+    return (derive(native) if native is not None else None), derive(reference), native_seconds, ffprobe_seconds
+
+def run_probe_compare(argv):
+    import argparse
+    parser = argparse.ArgumentParser(prog="Snipsnip.py probe-compare", description="So sánh kết quả đọc header MP4/MOV trực tiếp với ffprobe trên một thư mục media.")
+    parser.add_argument('media_dir', help="Thư mục chứa media cần so sánh"); parser.add_argument('--recursive', action='store_true', help="Quét cả thư mục con")
+    args = parser.parse_args(argv); root = Path(args.media_dir)
+    if not root.is_dir(): parser.error(f"Không tìm thấy thư mục: {root}")
+    media_files = sorted(path for path in (root.rglob('*') if args.recursive else root.iterdir()) if path.is_file() and path.suffix.lower() in NATIVE_HEADER_CONTAINERS | HEADER_BASED_CONTAINERS)
+    matched = mismatched = fallback = 0; native_total = ffprobe_total = 0.0
+    for video_path in media_files:
+        native_row, ffprobe_row, native_seconds, ffprobe_seconds = compare_probe_paths(video_path); ffprobe_total += ffprobe_seconds
+        if native_row is None: fallback += 1; print(f"[FFPROBE] {video_path.name}: không đọc được header, dùng ffprobe"); continue
+        native_total += native_seconds; differences = [field for field in PROBE_COMPARE_FIELDS if native_row[field] != ffprobe_row[field]]
+        if differences: mismatched += 1; print(f"[LỆCH] {video_path.name}: " + "; ".join(f"{field} header={native_row[field]!r} ffprobe={ffprobe_row[field]!r}" for field in differences))
+        else: matched += 1; print(f"[KHỚP] {video_path.name} ({native_seconds * 1000:.2f}ms so với {ffprobe_seconds * 1000:.1f}ms)")
+    print(f"{len(media_files)} file: {matched} khớp, {mismatched} lệch, {fallback} dùng ffprobe. Tổng thời gian đọc header {native_total * 1000:.1f}ms, ffprobe {ffprobe_total * 1000:.1f}ms.")
+    return 1 if mismatched else 0
+
+def run_timecode_benchmark(argv):
+    import argparse
+    parser = argparse.ArgumentParser(prog="Snipsnip.py bench-timecode", description="Đo tốc độ phân tích timecode (cũ so với engine mới).")
+    parser.add_argument('--rows', type=int, default=200000); parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv); results = benchmark_timecode(args.rows, args.repeat)
+    for key, value in results.items():
+        if key == 'rows': print(f"rows: {value}"); continue
+        print(f"{key:<22} {value * 1000:9.1f} ms  {results['rows'] / value / 1e6 if value else 0:7.2f} M dòng/s")
+    return 0
+
+FAKE_FFPROBE_SOURCE = '''import json, os, sys, time
+time.sleep(float(os.environ.get('SNIPSNIP_FAKE_FFPROBE_LATENCY', '0')))
+if '-count_packets' in sys.argv: print('90000'); sys.exit(0)
+is_mxf = sys.argv[-1].lower().endswith('.mxf')
+video = {"codec_type": "video", "codec_name": "mpeg2video" if is_mxf else "h264", "r_frame_rate": "25/1" if is_mxf else "30000/1001", "nb_frames": "90000", "duration": "3600.0", "width": 1920, "height": 1080, "color_transfer": "bt709", "tags": {"timecode": "00:00:00:00"}}
+print(json.dumps({"streams": [video, {"codec_type": "audio"}, {"codec_type": "audio"}], "format": {"tags": {}}}))
+'''
+BENCH_STAGES = ('read', 'clean', 'scan', 'scan_cached', 'xml')
+
+def _install_fake_ffprobe(bin_dir, latency):
+    script_path = bin_dir / "fake_ffprobe.py"; script_path.write_text(FAKE_FFPROBE_SOURCE, encoding='utf-8')
+    if os.name == 'nt': (bin_dir / "ffprobe.bat").write_text(f'@"{sys.executable}" "{script_path}" %*\r\n', encoding='utf-8')
+    else: launcher = bin_dir / "ffprobe"; launcher.write_text(f"#!/bin/sh\nexec '{sys.executable}' '{script_path}' \"$@\"\n", encoding='utf-8'); launcher.chmod(0o755)
+    os.environ['PATH'] = str(bin_dir) + os.pathsep + os.environ.get('PATH', ''); os.environ['SNIPSNIP_FAKE_FFPROBE_LATENCY'] = str(latency)
+
+def _generate_bench_inputs(work_dir, row_count, seed=1234):
+    import random
+    rng = random.Random(seed + row_count); media_dir = work_dir / f"media_{row_count}"; media_dir.mkdir()
+    media_names = [f"C{i:04d}.MP4" if i % 5 else f"A{i:03d}C001_{i:06d}.MXF" for i in range(max(10, min(2000, row_count // 10)))]
+    for name in media_names: (media_dir / name).touch()
+    def clip_range():
+        start = rng.randint(0, 240); return f"{start // 60}:{start % 60:02d}-{(start + rng.randint(2, 30)) // 60}:{(start + rng.randint(2, 30)) % 60:02d}"
+    script_path = work_dir / f"script_{row_count}.csv"; raw_path = work_dir / f"raw_sheet_{row_count}.csv"
+    with open(script_path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f); writer.writerow(['filename', 'Time in - time out'])
+        for i in range(row_count): writer.writerow([f"MISSING_{i}.MP4" if rng.random() < 0.02 else rng.choice(media_names), clip_range()])
+    with open(raw_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f); writer.writerow(['', 'KỊCH BẢN MEDIA TOUR', '', '', '', '', '', '']); writer.writerow(['Frame', 'Cảnh', 'Timecode', 'DURATION (sec)', 'Source', 'Text hiển thị trên hình (nếu có)', 'Voice Off (nếu có)\n', 'Note'])
+        for i in range(row_count):
+            roll = rng.random()
+            if roll < 0.03: writer.writerow([f"{i}. Phân đoạn mới", '', '', '', '', '', '', '']); continue
+            timecode = clip_range().replace('-', ' - ')
+            if roll < 0.15: timecode += f" (mời các bạn), {clip_range()}"
+            writer.writerow(['', f"Cảnh số {i}" + (" (BỎ)" if roll > 0.98 else ''), timecode, str(rng.randint(2, 30)), rng.choice(media_names), '', 'Voice thực tế của HDV' if roll < 0.5 else '', 'X' if roll < 0.2 else ''])
+    return script_path, raw_path, media_dir
+
+def _bench_scan(rows, media_dir, workers, metadata_cache):
+    media_index = MediaIndex(media_dir); media_index.refresh()
+    probe_once = make_shared_probe(lambda path: metadata_cache.get_or_probe(path, probe=lambda p: get_video_metadata(p, light=True), variant=probe_variant(True, False)))
+    with ThreadPoolExecutor(max_workers=workers) as pool: results = list(pool.map(lambda row: validate_row(row.copy(), media_index.find, probe_once, metadata_cache, probe_variant(True, False)), rows))
+    metadata_cache.flush()
+    return [row for row, _ in results], Counter(framerate for _, framerate in results if framerate)
+
+def benchmark_pipeline(sizes, latency=0.0, workers=None, repeat=1, work_dir=None):
+    work_dir = Path(work_dir or tempfile.mkdtemp(prefix="snipsnip_bench_")); bin_dir = work_dir / "bin"; bin_dir.mkdir(parents=True, exist_ok=True)
+    _install_fake_ffprobe(bin_dir, latency); workers = workers or os.cpu_count() or 4; quiet = lambda message, status_type=None: None; results = {}
+    for row_count in sizes:
+        script_path, raw_path, media_dir = _generate_bench_inputs(work_dir, row_count); raw_data = raw_path.read_bytes(); timings = {stage: [] for stage in BENCH_STAGES}
+        for attempt in range(repeat):
+            started = time.perf_counter(); rows = read_csv_rows(script_path, log=quiet); timings['read'].append(time.perf_counter() - started)
+            started = time.perf_counter(); list(iter_google_sheet_rows(raw_data)); timings['clean'].append(time.perf_counter() - started)
+            metadata_cache = MetadataCache(work_dir / f"metadata_{row_count}_{attempt}.sqlite")
+            started = time.perf_counter(); _bench_scan(rows, media_dir, workers, metadata_cache); timings['scan'].append(time.perf_counter() - started)
+            started = time.perf_counter(); processed, framerates = _bench_scan(rows, media_dir, workers, metadata_cache); timings['scan_cached'].append(time.perf_counter() - started)
+            for row in processed:
+                if is_error_row(row): mark_as_gap(row)
+            timeline_fps = framerates.most_common(1)[0][0] if framerates else 25.0
+            started = time.perf_counter(); write_sequence_xml(processed, work_dir / f"bench_{row_count}.xml", "Bench", timeline_fps, "1920", "1080", quiet); timings['xml'].append(time.perf_counter() - started)
+        results[str(row_count)] = {stage: round(min(values), 6) for stage, values in timings.items()}
+    return {'python': sys.version.split()[0], 'platform': sys.platform, 'latency': latency, 'workers': workers, 'repeat': repeat, 'results': results}
+
+def find_bench_regressions(baseline, current, threshold, min_delta=0.005):
+    regressions = []
+    for size, stages in current['results'].items():
+        for stage, seconds in stages.items():
+            previous = baseline.get('results', {}).get(size, {}).get(stage)
+            if previous and seconds > previous * (1 + threshold) and seconds - previous > min_delta: regressions.append((size, stage, previous, seconds))
+    return regressions
+
+def run_pipeline_benchmark(argv):
+    import argparse
+    parser = argparse.ArgumentParser(prog="Snipsnip.py bench", description="Đo tốc độ từng bước đọc kịch bản → dọn Google Sheet → quét → tạo XML trên dữ liệu giả lập.")
+    parser.add_argument('--sizes', default='100,1000,10000,50000', help="Số dòng kịch bản, cách nhau bởi dấu phẩy")
+    parser.add_argument('--latency', type=float, default=0.002, help="Độ trễ (giây) của ffprobe giả cho mỗi lần gọi")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4); parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--out', default='bench_results.json', help="File JSON ghi kết quả")
+    parser.add_argument('--baseline', help="File JSON kết quả cũ để so sánh")
+    parser.add_argument('--threshold', type=float, default=0.2, help="Mức chậm hơn cho phép so với baseline (0.2 = 20%%)")
+    parser.add_argument('--keep', action='store_true', help="Giữ lại thư mục dữ liệu giả lập")
+    args = parser.parse_args(argv)
+    try: sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    except ValueError: parser.error("--sizes phải là danh sách số nguyên, ví dụ 100,1000")
+    work_dir = Path(tempfile.mkdtemp(prefix="snipsnip_bench_"))
+    try: report = benchmark_pipeline(sizes, args.latency, args.workers, max(1, args.repeat), work_dir)
+    finally:
+        if not args.keep: shutil.rmtree(work_dir, ignore_errors=True)
+    print(f"{'rows':>8} " + " ".join(f"{stage:>12}" for stage in BENCH_STAGES))
+    for size, stages in report['results'].items(): print(f"{size:>8} " + " ".join(f"{stages[stage] * 1000:>10.1f}ms" for stage in BENCH_STAGES))
+    with open(args.out, 'w', encoding='utf-8') as f: json.dump(report, f, indent=2)
+    print(f"Đã ghi kết quả: {args.out}" + (f" (dữ liệu giả lập: {work_dir})" if args.keep else ""))
+    if not args.baseline: return 0
+    with open(args.baseline, 'r', encoding='utf-8') as f: baseline = json.load(f)
+    regressions = find_bench_regressions(baseline, report, args.threshold)
+    for size, stage, previous, seconds in regressions: print(f"[CHẬM HƠN] {size} dòng / {stage}: {previous * 1000:.1f}ms -> {seconds * 1000:.1f}ms (+{(seconds / previous - 1) * 100:.0f}%)")
+    if not regressions: print(f"Không có bước nào chậm hơn baseline quá {args.threshold * 100:.0f}%.")
+    return 1 if regressions else 0
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch': sys.exit(run_batch(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench-timecode': sys.exit(run_timecode_benchmark(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench': sys.exit(run_pipeline_benchmark(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'probe-compare': sys.exit(run_probe_compare(sys.argv[2:]))
+    if GUI_IMPORT_ERROR is not None: sys.exit(f"Không mở được giao diện vì thiếu thư viện GUI ({GUI_IMPORT_ERROR}). Các lệnh batch, bench, bench-timecode và probe-compare vẫn chạy được không cần giao diện.")
     app = AutoCutApp()
+    if len(sys.argv) > 1 and sys.argv[1] == 'startup-time': app.after_idle(lambda: (print(app.format_startup_time()), app.destroy()))
     app.mainloop()